@@ -1,8 +1,17 @@
 import streamlit as st
+from utils.load_model import warm_up
+from utils.metrics import start_metrics_server
 
 def main():
     st.set_page_config(page_title="Advanced Math Problem Solver", page_icon="🧮", layout="wide")
 
+    # Load the OCR model in the background so it is ready by the time a
+    # user opens the Document Solver or Math Sketchboard
+    warm_up()
+
+    # Prometheus endpoint for stage latencies, cache hits and model calls
+    start_metrics_server()
+
     st.markdown(
         """
         <style>
@@ -0,0 +1,179 @@
+# ######################################################
+#                                                      #
+#      Headless batch solving: read problems, images   #
+#      and PDFs, and stream the answers to JSONL.      #
+#                                                      #
+# ######################################################
+#
+# Usage:
+#     python batch_solve.py problems.jsonl -o answers.jsonl [--workers 4] [--mode quick]
+#     python batch_solve.py problems/ -o answers.jsonl
+#
+# A JSONL input has one job per line: {"id": ..., "problem": "..."} for a
+# typed problem, or {"id": ..., "image": "path"} / {"id": ..., "pdf": "path"}
+# to OCR the file first; "mode" optionally overrides --mode. Paths are
+# relative to the JSONL file. A directory input makes one job per .txt,
+# image or PDF file, with the relative path as its id.
+#
+# Every result is appended to the output as soon as it is ready, so the
+# output doubles as the checkpoint: rerunning the same command skips the
+# jobs that already have an answer and retries the ones that failed.
+
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from utils.core import SOLVE_MODES, extract, solve, is_image_file
+from utils.symbolic import warm_up
+
+
+def read_jobs(source):
+    # Yield job dicts from a JSONL file or a directory
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                job_id = os.path.relpath(path, source)
+                if name.lower().endswith(".txt"):
+                    with open(path, encoding="utf-8") as f:
+                        yield {"id": job_id, "problem": f.read().strip()}
+                elif name.lower().endswith(".pdf"):
+                    yield {"id": job_id, "pdf": path}
+                elif is_image_file(name):
+                    yield {"id": job_id, "image": path}
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault("id", line_number)
+            for key in ("image", "pdf"):
+                if key in job:
+                    job[key] = os.path.join(base, job[key])
+            yield job
+
+
+def load_checkpoint(path):
+    # Ids that already have an answer in the output file. A line cut short
+    # by an interrupted run is ignored, and its job runs again.
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "answer" in record:
+                done.add(record["id"])
+    return done
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def run_job(job, mode, temperature, dpi):
+    start = time.perf_counter()
+    record = {"id": job["id"], "mode": job.get("mode", mode)}
+    try:
+        if "problem" in job:
+            problem = job["problem"]
+        else:
+            latex = extract(job.get("image") or job["pdf"], temperature=temperature, dpi=dpi)
+            record["latex"] = latex
+            if not latex:
+                raise ValueError("No equations found")
+            problem = "\n".join(latex)
+        record["problem"] = problem
+        record["answer"] = solve(problem, record["mode"])
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def solve_all(jobs, out_file, workers=4, mode="quick", temperature=0.0, dpi=96, done=()):
+    """
+    Run jobs on a thread pool and write each result to out_file as it completes.
+
+    At most twice as many jobs as workers are in flight, so a long input is
+    read lazily and an interrupted run loses only the jobs being worked on.
+
+    Returns:
+    dict: Counts of 'solved', 'failed' and 'skipped' jobs.
+    """
+    counts = {"solved": 0, "failed": 0, "skipped": 0}
+    pending = set()
+
+    def write(record):
+        out_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out_file.flush()
+        counts["failed" if "error" in record else "solved"] += 1
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-solve")
+    try:
+        for job in jobs:
+            if job["id"] in done:
+                counts["skipped"] += 1
+                continue
+            if len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future.result())
+            pending.add(executor.submit(run_job, job, mode, temperature, dpi))
+        for future in wait(pending).done:
+            write(future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve problems, images and PDFs in bulk.")
+    parser.add_argument("source", help="JSONL file of jobs, or a directory of .txt, image and PDF files")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL file; also the checkpoint for resuming")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs processed at the same time")
+    parser.add_argument("--mode", choices=SOLVE_MODES, default="quick", help="How problems are solved")
+    parser.add_argument("--temperature", type=float, default=0.0, help="texify sampling temperature")
+    parser.add_argument("--dpi", type=int, default=96, help="Render resolution for PDF pages")
+    args = parser.parse_args(argv)
+
+    done = load_checkpoint(args.output)
+    warm_up()
+
+    with open(args.output, "a", encoding="utf-8") as out_file:
+        if not ends_with_newline(args.output):
+            # Start on a fresh line after a record cut off by the last run
+            out_file.write("\n")
+        counts = solve_all(
+            read_jobs(args.source),
+            out_file,
+            workers=args.workers,
+            mode=args.mode,
+            temperature=args.temperature,
+            dpi=args.dpi,
+            done=done,
+        )
+
+    print(f"Solved {counts['solved']}, failed {counts['failed']}, "
+          f"skipped {counts['skipped']} already answered", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
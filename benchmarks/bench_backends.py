@@ -0,0 +1,111 @@
+# ######################################################
+#                                                      #
+#     Accuracy/latency comparison of the texify        #
+#     inference backends on a fixed set of crops.      #
+#                                                      #
+# ######################################################
+#
+# Usage:
+#     python benchmarks/bench_backends.py [--backends torch int8 onnx] [--tolerance 0.95]
+#
+# The first backend is the reference. Every backend runs the same rendered
+# equation crops at temperature 0, and its LaTeX is compared with the
+# reference output by normalized similarity. The report recommends the
+# fastest backend whose mean similarity stays within the tolerance.
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import equation_crops
+from utils.load_model import BACKENDS, load_backend
+
+
+def similarity(a, b):
+    # Whitespace-insensitive similarity of two LaTeX strings, from 0 to 1
+    return SequenceMatcher(None, "".join(a.split()), "".join(b.split())).ratio()
+
+
+def run_backend(name, crops, batch_size, repeat):
+    start = time.perf_counter()
+    backend = load_backend(name)
+    load_seconds = time.perf_counter() - start
+
+    # One untimed pass so lazy initialisation doesn't count against the backend
+    backend.infer(crops[:1], 0.0)
+
+    batch_times = []
+    outputs = []
+    for _ in range(repeat):
+        outputs = []
+        for i in range(0, len(crops), batch_size):
+            start = time.perf_counter()
+            outputs.extend(backend.infer(crops[i:i + batch_size], 0.0))
+            batch_times.append(time.perf_counter() - start)
+
+    return {
+        "load_seconds": load_seconds,
+        "batch_median_seconds": statistics.median(batch_times),
+        "per_crop_seconds": sum(batch_times) / (repeat * len(crops)),
+        "outputs": outputs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare texify inference backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), help="Backends to compare; the first is the reference")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.95, help="Minimum mean similarity to the reference")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    crops = equation_crops()
+    results = {}
+    for name in args.backends:
+        try:
+            results[name] = run_backend(name, crops, args.batch_size, args.repeat)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:6s} unavailable: {results[name]['error']}")
+
+    reference = results.get(args.backends[0], {}).get("outputs")
+    if reference is None:
+        print("The reference backend failed; nothing to compare against.")
+        return 1
+
+    candidates = []
+    for name, result in results.items():
+        if "error" in result:
+            continue
+        scores = [similarity(out, ref) for out, ref in zip(result["outputs"], reference)]
+        result["mean_similarity"] = statistics.mean(scores)
+        result["min_similarity"] = min(scores)
+        result["within_tolerance"] = result["mean_similarity"] >= args.tolerance
+        if result["within_tolerance"]:
+            candidates.append((result["per_crop_seconds"], name))
+        print(
+            f"{name:6s} load {result['load_seconds']:6.1f}s  "
+            f"{result['per_crop_seconds'] * 1000:8.1f} ms/crop  "
+            f"similarity {result['mean_similarity']:.3f} (min {result['min_similarity']:.3f})"
+        )
+
+    recommended = min(candidates)[1] if candidates else args.backends[0]
+    print(f"Recommended backend: {recommended} (set MATHGPT_OCR_BACKEND={recommended})")
+
+    report = {"recommended": recommended, "tolerance": args.tolerance, "backends": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# ######################################################
+#                                                      #
+#     Startup-time benchmark: how long each page's     #
+#     imports take, and whether they pull in torch.    #
+#                                                      #
+# ######################################################
+#
+# Usage:
+#     python benchmarks/bench_startup.py [--repeat 5] [--budget 1.0]
+#
+# Each page's import statements are read from its source and run in a fresh
+# interpreter, so the timing matches a cold page load. Exits non-zero if a
+# page that does not use OCR imports torch or exceeds the budget.
+
+
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = {
+    "Home": ("app.py", False),
+    "QuickSolve": ("pages/QuickSolve.py", False),
+    "Document Solver": ("pages/Document Solver.py", True),
+    "Math Sketchboard": ("pages/Math Sketchboard.py", True),
+}
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "torch": "torch" in sys.modules, "texify": "texify.inference" in sys.modules}}))
+"""
+
+
+def page_imports(path):
+    # The top-level import statements of a page, as source code
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(
+        ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def time_imports(imports):
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(imports=imports)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of each page.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per page")
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds allowed for pages without OCR")
+    args = parser.parse_args(argv)
+
+    failed = False
+    report = {}
+    for name, (path, uses_ocr) in PAGES.items():
+        imports = page_imports(path)
+        runs = [time_imports(imports) for _ in range(args.repeat)]
+        seconds = statistics.median(run["seconds"] for run in runs)
+        loads_model = any(run["torch"] or run["texify"] for run in runs)
+        ok = uses_ocr or (seconds <= args.budget and not loads_model)
+        failed = failed or not ok
+        report[name] = {"median_seconds": round(seconds, 4), "imports_torch": loads_model, "ok": ok}
+        print(f"{name:18s} {seconds * 1000:8.1f} ms  torch={'yes' if loads_model else 'no ':3s}  {'ok' if ok else 'FAIL'}")
+
+    print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
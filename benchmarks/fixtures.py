@@ -0,0 +1,88 @@
+# ######################################################
+#                                                      #
+#      Deterministic inputs shared by the benchmarks   #
+#                                                      #
+# ######################################################
+
+
+import io
+
+from PIL import Image
+from matplotlib.figure import Figure
+
+# Equations rendered into the fixed crop set, with their source LaTeX
+EQUATIONS = [
+    r"x^2 + 5x + 6 = 0",
+    r"\frac{a}{b} + \frac{c}{d} = \frac{ad + bc}{bd}",
+    r"\int_0^1 x^2 \, dx = \frac{1}{3}",
+    r"\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}",
+    r"e^{i\pi} + 1 = 0",
+    r"\sqrt{x^2 + y^2} = r",
+    r"\lim_{x \to 0} \frac{\sin x}{x} = 1",
+    r"f'(x) = 3x^2 - 2x + 1",
+    r"\alpha + \beta = \gamma",
+    r"y = mx + b",
+    r"\log_2 8 = 3",
+    r"(a + b)^2 = a^2 + 2ab + b^2",
+]
+
+
+def render_equation(latex, fontsize=28, dpi=96):
+    # Render LaTeX with matplotlib's mathtext into a tightly cropped RGB image
+    fig = Figure(figsize=(8, 1.5), dpi=dpi)
+    fig.text(0.02, 0.5, f"${latex}$", fontsize=fontsize, va="center")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0.1, facecolor="white")
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+def equation_crops(fontsize=28):
+    return [render_equation(latex, fontsize) for latex in EQUATIONS]
+
+
+# Expressions drawn by the plotting benchmark: polynomials, poles, roots,
+# trigonometry and implicit curves
+PLOT_EXPRESSIONS = [
+    "x^2 - 4",
+    "y = 3x + 2",
+    "1/x",
+    "tan(x)",
+    "sin(x) * exp(-x/5)",
+    "sqrt(x)",
+    "log(x)",
+    "x^3 - 2x^2 + x - 1",
+    "x^2 + y^2 = 25",
+    "y^2 = x^3 - x",
+    "abs(x - 2)",
+    "(x^2 - 1)/(x - 3)",
+]
+
+# Typed problems for the QuickSolve flow; the first ones are answered by
+# sympy, the rest go to the LLM
+QUICKSOLVE_PROBLEMS = [
+    "x^2 + 5x + 6 = 0",
+    "d/dx sin(x)^2",
+    "integrate x*exp(x) dx",
+    "factor x^3 - 8",
+    "2/3 + 5/7",
+    "A train travels 120 km in 1.5 hours. What is its average speed?",
+    "Prove that the square root of 2 is irrational",
+    "What is the probability of rolling two sixes with two dice?",
+]
+
+
+def synthetic_pdf(pages, equations_per_page=6):
+    # A multi-page PDF of typeset equations, as bytes
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    buffer = io.BytesIO()
+    with PdfPages(buffer) as pdf:
+        for page in range(pages):
+            fig = Figure(figsize=(8.27, 11.69))
+            fig.text(0.08, 0.95, f"Exercise sheet, page {page + 1}", fontsize=14)
+            for row in range(equations_per_page):
+                latex = EQUATIONS[(page * equations_per_page + row) % len(EQUATIONS)]
+                fig.text(0.1, 0.85 - row * 0.13, f"{row + 1}.  ${latex}$", fontsize=20)
+            pdf.savefig(fig)
+    return buffer.getvalue()
@@ -0,0 +1,353 @@
+# ######################################################
+#                                                      #
+#     Offline benchmark suite for PDF rendering, OCR,  #
+#      plotting and the end-to-end request flows.      #
+#                                                      #
+# ######################################################
+#
+# Usage:
+#     python benchmarks/run.py [--only pdf ocr plot flows] [--repeat 5] [--output results.json]
+#     python benchmarks/run.py --compare baseline.json [--threshold 0.2]
+#
+# The LLM is replaced by a stand-in that replays canned answers with a
+# configurable latency, and OCR by a stand-in whose cost grows with the batch
+# like texify's does (--ocr torch/int8/onnx runs the real model instead).
+# Every benchmark is run --repeat times from cold caches; the report has
+# p50/p95/p99 latencies, the Python heap high-water mark of one extra run
+# and the process RSS high-water mark. With --compare, a benchmark whose p50
+# or peak memory grew by more than --threshold over the baseline is reported
+# as a regression and the exit code is 1.
+
+
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import platform
+import resource
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+# Reproducible runs: no persistent caches, no background prefetching and no
+# metrics endpoint. Must be set before utils is imported.
+os.environ["MATHGPT_OCR_CACHE_DB"] = ""
+os.environ["MATHGPT_SOLUTION_CACHE_DB"] = ""
+os.environ["MATHGPT_PREFETCH_PAGES"] = "0"
+os.environ["MATHGPT_METRICS_PORT"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import (
+    EQUATIONS,
+    PLOT_EXPRESSIONS,
+    QUICKSOLVE_PROBLEMS,
+    equation_crops,
+    synthetic_pdf,
+)
+
+SUITES = ("pdf", "ocr", "plot", "flows")
+
+# Canned LLM answers, picked by prompt hash so a prompt always gets the same one
+CANNED_ANSWERS = [
+    "Factor the quadratic: $(x + 2)(x + 3) = 0$, so $x = -2$ or $x = -3$.",
+    "Average speed is distance over time: $120 / 1.5 = 80$ km/h.",
+    "Assume $\\sqrt{2} = p/q$ in lowest terms; then $p^2 = 2q^2$, so both are even, a contradiction.",
+    "Each die shows a six with probability $1/6$, so two sixes have probability $1/36$.",
+]
+
+
+class FakeCompletions:
+    """Replays canned answers in the g4f/OpenAI shape, with simulated latency."""
+
+    def __init__(self, ttft, chunk_delay, chunk_size=8):
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+
+    def _answer(self, messages):
+        digest = hashlib.blake2b(messages[-1]["content"].encode(), digest_size=4).digest()
+        return CANNED_ANSWERS[int.from_bytes(digest, "big") % len(CANNED_ANSWERS)]
+
+    async def create(self, model, messages, stream=False):
+        answer = self._answer(messages)
+        if not stream:
+            chunks = -(-len(answer) // self.chunk_size)
+            await asyncio.sleep(self.ttft + chunks * self.chunk_delay)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+        return self._stream(answer)
+
+    async def _stream(self, answer):
+        await asyncio.sleep(self.ttft)
+        for i in range(0, len(answer), self.chunk_size):
+            await asyncio.sleep(self.chunk_delay)
+            delta = SimpleNamespace(content=answer[i:i + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def fake_ocr(batch_overhead, per_crop):
+    # Fixed cost per forward pass plus a cost per crop, so batching pays off
+    # the way it does with texify
+    def infer(images, temperature):
+        time.sleep(batch_overhead + per_crop * len(images))
+        return [f"$${EQUATIONS[(image.width + image.height) % len(EQUATIONS)]}$$" for image in images]
+    return infer
+
+
+def install_stand_ins(args):
+    from utils import llm_client
+    from utils.llm_client import LLMClient
+    from utils.ocr_service import configure_ocr_service
+    from utils.load_model import load_backend
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(args.llm_ttft, args.llm_chunk_delay)))
+    llm_client._client = LLMClient(client=client, retries=0)
+
+    if args.ocr == "fake":
+        configure_ocr_service(infer=fake_ocr(args.ocr_overhead, args.ocr_per_crop))
+    else:
+        backend = load_backend(args.ocr)
+        configure_ocr_service(infer=backend.infer)
+
+
+def summarize(samples):
+    values = np.array(samples)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "runs": len(samples),
+        "mean_seconds": float(values.mean()),
+        "p50_seconds": float(p50),
+        "p95_seconds": float(p95),
+        "p99_seconds": float(p99),
+    }
+
+
+def measure(fn, repeat, setup=None):
+    # Time repeat runs of fn, each after setup(); then one more run under
+    # tracemalloc for the heap high-water mark, kept out of the timings
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = summarize(samples)
+    result["peak_heap_bytes"] = peak
+    return result
+
+
+def clear_caches():
+    from utils import documents
+    from utils.helper import ocr_cache, region_cache
+    from utils.solutions import solution_cache
+    from utils.plot_engine import expression_cache
+
+    documents.clear_cache()
+    for cache in (ocr_cache, region_cache, solution_cache, expression_cache):
+        cache.clear()
+
+
+def bench_pdf(args):
+    from utils.helper import get_page_image, page_count
+
+    results = {}
+    for pages in args.pages:
+        data = synthetic_pdf(pages)
+        for dpi in args.dpis:
+            def render_all():
+                upload = io.BytesIO(data)
+                for page in range(1, page_count(upload) + 1):
+                    get_page_image(upload, page, dpi)
+            results[f"pdf/render/pages={pages}/dpi={dpi}"] = measure(render_all, args.repeat, setup=clear_caches)
+    return results
+
+
+def bench_ocr(args):
+    from utils.helper import infer_image, infer_images
+
+    crops = equation_crops()
+    boxes = [(0, 0, crop.width, crop.height) for crop in crops]
+
+    # The same crops laid out side by side on one page, for the batched call
+    pixels = np.full((max(crop.height for crop in crops), sum(crop.width for crop in crops), 3), 255, dtype=np.uint8)
+    page_boxes, left = [], 0
+    for crop in crops:
+        pixels[:crop.height, left:left + crop.width] = np.asarray(crop)
+        page_boxes.append((left, 0, left + crop.width, crop.height))
+        left += crop.width
+    page = Image.fromarray(pixels)
+
+    def single():
+        for crop, box in zip(crops, boxes):
+            infer_image(crop, box, 0.0)
+
+    def batched():
+        infer_images(page, page_boxes, 0.0)
+
+    return {
+        f"ocr/single/crops={len(crops)}": measure(single, args.repeat, setup=clear_caches),
+        f"ocr/batch/crops={len(crops)}": measure(batched, args.repeat, setup=clear_caches),
+    }
+
+
+def bench_plot(args):
+    import matplotlib
+    matplotlib.use("Agg")
+    from utils.plotting import plot_function
+    from utils.symbolic import warm_up, worker
+
+    # Worker start-up is a one-off cost, not part of plotting
+    warm_up()
+    worker.run(sum, [], timeout=60)
+
+    def plot_corpus():
+        for expression in PLOT_EXPRESSIONS:
+            if plot_function(expression) is None:
+                raise RuntimeError(f"Could not plot {expression}")
+
+    def plot_warm():
+        for expression in PLOT_EXPRESSIONS:
+            plot_function(expression)
+
+    plot_corpus()
+    return {
+        f"plot/cold/expressions={len(PLOT_EXPRESSIONS)}": measure(plot_corpus, args.repeat, setup=clear_caches),
+        f"plot/warm/expressions={len(PLOT_EXPRESSIONS)}": measure(plot_warm, args.repeat),
+    }
+
+
+def bench_flows(args):
+    from utils.helper import get_page_image, infer_images, page_count, propose_page_regions, resize_image, get_canvas_hash
+    from utils.prompting import prompt_FP, prompt_SQ, prompt_StepByStep
+    from utils.solutions import cached_stream, cached_submit
+    from utils.symbolic import solve_symbolic, warm_up, worker
+
+    warm_up()
+    worker.run(sum, [], timeout=60)
+    data = synthetic_pdf(2)
+
+    def document_solver():
+        # Upload, render and resize the page, OCR the detected boxes and
+        # stream the answer, as the page does for one chat message
+        upload = io.BytesIO(data)
+        page_count(upload)
+        image = get_page_image(upload, 1)
+        display = resize_image(image)
+        boxes = propose_page_regions(display, get_canvas_hash(display))
+        inferences = infer_images(display, boxes, 0.7)
+        for _ in cached_stream(prompt_FP, "Solve these problems", inferences):
+            pass
+
+    def quicksolve():
+        for problem in QUICKSOLVE_PROBLEMS:
+            if solve_symbolic(problem):
+                continue
+            explanation = cached_submit(prompt_StepByStep, problem)
+            for _ in cached_stream(prompt_SQ, problem):
+                pass
+            explanation.result()
+
+    return {
+        "flow/document_solver": measure(document_solver, args.repeat, setup=clear_caches),
+        f"flow/quicksolve/problems={len(QUICKSOLVE_PROBLEMS)}": measure(quicksolve, args.repeat, setup=clear_caches),
+    }
+
+
+def max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def compare(results, baseline, threshold):
+    # Benchmarks whose p50 or peak heap grew by more than threshold
+    regressions = []
+    print(f"{'benchmark':48s} {'p50':>9s} {'baseline':>9s} {'change':>8s}")
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            print(f"{name:48s} {current['p50_seconds']:9.4f} {'-':>9s} {'new':>8s}")
+            continue
+        change = current["p50_seconds"] / max(previous["p50_seconds"], 1e-9) - 1
+        print(f"{name:48s} {current['p50_seconds']:9.4f} {previous['p50_seconds']:9.4f} {change:+8.1%}")
+        if change > threshold:
+            regressions.append(f"{name}: p50 {change:+.1%}")
+        memory = current["peak_heap_bytes"] / max(previous["peak_heap_bytes"], 1) - 1
+        if memory > threshold:
+            regressions.append(f"{name}: peak heap {memory:+.1%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite.")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES), help="Suites to run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10], help="PDF page counts")
+    parser.add_argument("--dpis", type=int, nargs="+", default=[72, 96, 150], help="PDF render resolutions")
+    parser.add_argument("--ocr", default="fake", help="'fake' or a texify backend: torch, int8, onnx")
+    parser.add_argument("--ocr-overhead", type=float, default=0.05, help="Fake OCR seconds per batch")
+    parser.add_argument("--ocr-per-crop", type=float, default=0.01, help="Fake OCR seconds per crop")
+    parser.add_argument("--llm-ttft", type=float, default=0.2, help="Fake LLM seconds to the first chunk")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.005, help="Fake LLM seconds per chunk")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative growth before a regression")
+    args = parser.parse_args(argv)
+
+    install_stand_ins(args)
+
+    suites = {"pdf": bench_pdf, "ocr": bench_ocr, "plot": bench_plot, "flows": bench_flows}
+    benchmarks = {}
+    for name in args.only:
+        for bench, result in suites[name](args).items():
+            benchmarks[bench] = result
+            print(f"{bench:48s} p50 {result['p50_seconds']:.4f}s  p95 {result['p95_seconds']:.4f}s  "
+                  f"p99 {result['p99_seconds']:.4f}s  heap {result['peak_heap_bytes'] / 2**20:.1f} MiB", file=sys.stderr)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "benchmarks": benchmarks,
+        "max_rss_bytes": max_rss_bytes(),
+    }
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
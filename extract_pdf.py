@@ -0,0 +1,170 @@
+# ######################################################
+#                                                      #
+#      Headless bulk extraction: OCR every page of     #
+#      a PDF and stream the results to a JSONL file.   #
+#                                                      #
+# ######################################################
+#
+# Usage:
+#     python extract_pdf.py problems.pdf -o problems.jsonl
+#
+# Pages are rendered on a background thread and handed to the OCR loop
+# through a bounded queue, so memory stays flat regardless of page count.
+# Only regions that look like equations are kept, and those with a usable
+# PDF text layer are read from it instead of being OCR'd.
+
+
+import sys
+import json
+import queue
+import argparse
+import threading
+
+import pypdfium2
+
+from utils.layout import propose_regions, equation_regions
+from utils.documents import PDFIUM_LOCK, text_in_boxes, looks_like_math
+from utils.helper import infer_crops, clean_text, MAX_BATCH_SIZE
+from utils.ocr_service import configure_ocr_service
+
+# Marks the end of the rendered pages on the queue
+_DONE = object()
+
+
+def page_regions(page, image):
+    # Equation regions of a rendered page, with the text-layer reading of
+    # each one, or None where it has to be OCR'd
+    regions = propose_regions(image)
+    with PDFIUM_LOCK:
+        texts = text_in_boxes(page, regions, image.size) if regions else []
+    texts = [clean_text(text) if text and looks_like_math(text) else None for text in texts]
+    # Headings, prose and page numbers are dropped here
+    kept = equation_regions(image, regions, texts)
+    return [(bbox, text) for bbox, text in zip(regions, texts) if bbox in kept]
+
+
+def render_pages(pdf_path, dpi, chunk_size, pages, stop):
+    # Render the document chunk by chunk and put each chunk of
+    # (page_number, image, regions) tuples on the queue. Blocks while the
+    # queue is full.
+    try:
+        with PDFIUM_LOCK:
+            doc = pypdfium2.PdfDocument(pdf_path)
+            total = len(doc)
+        try:
+            for start in range(0, total, chunk_size):
+                chunk = []
+                for index in range(start, min(start + chunk_size, total)):
+                    with PDFIUM_LOCK:
+                        page = doc[index]
+                        bitmap = page.render(scale=dpi / 72)
+                        image = bitmap.to_pil().convert("RGB")
+                        bitmap.close()
+                    try:
+                        regions = page_regions(page, image)
+                    finally:
+                        with PDFIUM_LOCK:
+                            page.close()
+                    chunk.append((index + 1, image, regions))
+                while not stop.is_set():
+                    try:
+                        pages.put(chunk, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        finally:
+            with PDFIUM_LOCK:
+                doc.close()
+    except Exception as e:
+        pages.put(e)
+        return
+    pages.put(_DONE)
+
+
+def extract_document(pdf_path, out_file, dpi=96, temperature=0.0, chunk_size=4,
+                     queue_size=2, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Read every equation region of every page and write one JSON line per region.
+
+    Regions with a usable text layer are written from it; the others are
+    OCR'd. Crops are accumulated across pages until a full batch is ready,
+    so small pages do not waste a forward pass. Each batch is flushed to
+    out_file as soon as it is inferred.
+
+    Returns:
+    int: The number of regions written.
+    """
+    configure_ocr_service(max_batch_size=max_batch_size)
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    renderer = threading.Thread(
+        target=render_pages, args=(pdf_path, dpi, chunk_size, pages, stop), daemon=True
+    )
+    renderer.start()
+
+    pending = []
+    written = 0
+
+    def flush():
+        nonlocal written
+        ocr = iter(infer_crops([crop for _, _, crop, _ in pending if crop is not None], temperature))
+        for page_number, bbox, crop, text in pending:
+            latex = next(ocr) if crop is not None else text
+            out_file.write(json.dumps({"page": page_number, "bbox": bbox, "latex": latex}) + "\n")
+        out_file.flush()
+        written += len(pending)
+        pending.clear()
+
+    try:
+        while True:
+            chunk = pages.get()
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            for page_number, image, regions in chunk:
+                for bbox, text in regions:
+                    crop = image.crop(bbox) if text is None else None
+                    pending.append((page_number, bbox, crop, text))
+                    if sum(item[2] is not None for item in pending) >= max_batch_size:
+                        flush()
+        if pending:
+            flush()
+    finally:
+        stop.set()
+        renderer.join()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR every page of a PDF into JSONL.")
+    parser.add_argument("pdf", help="Path to the PDF file")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--dpi", type=int, default=96, help="Render resolution")
+    parser.add_argument("--temperature", type=float, default=0.0, help="texify sampling temperature")
+    parser.add_argument("--chunk-size", type=int, default=4, help="Pages rendered per chunk")
+    parser.add_argument("--queue-size", type=int, default=2, help="Rendered chunks buffered ahead of OCR")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE, help="Crops per texify batch")
+    args = parser.parse_args(argv)
+
+    out_file = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        written = extract_document(
+            args.pdf,
+            out_file,
+            dpi=args.dpi,
+            temperature=args.temperature,
+            chunk_size=args.chunk_size,
+            queue_size=args.queue_size,
+            max_batch_size=args.batch_size,
+        )
+    finally:
+        if out_file is not sys.stdout:
+            out_file.close()
+    print(f"Extracted {written} regions from {args.pdf}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,35 @@
 import os
 
-from utils.load_model import load_modelANDprocessor
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"  # For MPS fallback
 
 
-import time
 import pandas as pd
 import streamlit as st
 
 from texify.output import replace_katex_invalid
 from streamlit_drawable_canvas import st_canvas
 
-from utils.load_model import load_modelANDprocessor
-from utils.llm import generate_response
+from utils.load_model import warm_up
+from utils.metrics import start_metrics_server, start_trace
+from utils.ocr_service import OCRServiceBusy
+from utils.llm import format_timings
 from utils.prompting import prompt_FP
+from utils.solutions import cached_stream
+from utils.speculation import SpeculativeOCR, box_key
+from utils.history import get_history, session_owner
 from utils.helper import (
-    infer_image,
+    ocr_cache_stats,
+    propose_page_regions,
+    regions_to_drawing,
     get_image_size,
     get_canvas_hash,
     get_page_image,
     get_uploaded_image,
+    image_key,
     page_count,
     resize_image,
+    scale_boxes,
+    submit_regions,
 )
 
 
@@ -62,8 +70,13 @@ st.markdown("""
 """)
 
 
-# Load the model and processor
-model , processor = load_modelANDprocessor()
+# Start loading the model in the background while the user picks a file
+warm_up()
+start_metrics_server()
+
+# Stage timings of this run, for the breakdown panel
+request_trace = start_trace()
+show_breakdown = st.sidebar.toggle("Show timing breakdown", value=False)
 
 # File uploader for PDF or image
 in_file = st.file_uploader("PDF file or image:", type=["pdf", "png", "jpg", "jpeg", "gif", "webp"])
@@ -75,12 +88,14 @@ filetype = in_file.type
 if "pdf" in filetype:
     total_pages = page_count(in_file)
     page_number = st.sidebar.number_input(f"Page number out of {total_pages}:", min_value=1, value=1, max_value=total_pages)
-    pil_image = get_page_image(in_file, page_number)
+    full_image = get_page_image(in_file, page_number)
+    full_key = image_key(in_file, page_number)
 else:
-    pil_image = get_uploaded_image(in_file)
+    full_image = get_uploaded_image(in_file)
+    full_key = image_key(in_file)
 
-# Resize the image
-resize_image(pil_image)
+# Display-size copy for the canvas; OCR crops come from the full-resolution image
+pil_image = resize_image(full_image, full_key)
 
 # Static temperature value
 temperature = 0.7  # Static temperature instead of slider
@@ -88,19 +103,38 @@ temperature = 0.7  # Static temperature instead of slider
 # Create a unique hash for the canvas
 canvas_hash = get_canvas_hash(pil_image) if pil_image else "canvas"
 
+fill_color = "rgba(255, 165, 0, 0.1)"  # Fixed fill color with some opacity
+stroke_color = "#FFAA00"
+
+# The uploaded PDF and page, for reading from the text layer
+pdf_page = (in_file, page_number) if "pdf" in filetype else (None, None)
+
+# Propose equation boxes automatically; the user removes the ones they don't
+# want in edit mode (double-click a box) and draws any that were missed
+auto_detect = st.sidebar.toggle("Detect equations automatically", value=False)
+edit_boxes = st.sidebar.toggle("Edit boxes", value=False, help="Move or resize boxes; double-click a box to remove it")
+initial_drawing = None
+if auto_detect and pil_image:
+    # Only lines that look like equations are proposed, so prose and
+    # headings are not sent to OCR
+    regions = propose_page_regions(pil_image, canvas_hash, *pdf_page)
+    initial_drawing = regions_to_drawing(regions, fill_color, stroke_color)
+
 # Create the canvas component
 canvas_result = st_canvas(
-    fill_color="rgba(255, 165, 0, 0.1)",  # Fixed fill color with some opacity
+    fill_color=fill_color,
     stroke_width=1,
-    stroke_color="#FFAA00",
+    stroke_color=stroke_color,
     background_color="#FFF",
     background_image=pil_image,
+    initial_drawing=initial_drawing,
     update_streamlit=True,
     height=get_image_size(pil_image)[0],
     width=get_image_size(pil_image)[1],
-    drawing_mode="rect",
+    drawing_mode="transform" if edit_boxes else "rect",
     point_display_radius=0,
-    key=canvas_hash,
+    # A new key resets the canvas when proposals are switched on or off
+    key=f"{canvas_hash}-auto" if auto_detect else canvas_hash,
 )
 
 # Extract the bounding box and inference if available
@@ -108,11 +142,26 @@ if canvas_result.json_data is not None:
     objects = pd.json_normalize(canvas_result.json_data["objects"])
     bbox_list = None
     if objects.shape[0] > 0:
-        boxes = objects[objects["type"] == "rect"][["left", "top", "width", "height"]]
+        boxes = objects[objects["type"] == "rect"].copy()
+        # Boxes resized in edit mode keep their width/height and change scale
+        if "scaleX" in boxes:
+            boxes["width"] = boxes["width"] * boxes["scaleX"].fillna(1)
+            boxes["height"] = boxes["height"] * boxes["scaleY"].fillna(1)
         boxes["right"] = boxes["left"] + boxes["width"]
         boxes["bottom"] = boxes["top"] + boxes["height"]
         bbox_list = boxes[["left", "top", "right", "bottom"]].values.tolist()
 
+    # Read the boxes in the background as soon as they are drawn, so the
+    # problems are extracted while the user types the request. Boxes are
+    # drawn on the display copy; OCR crops come from the full image.
+    if "speculative_ocr" not in st.session_state:
+        st.session_state.speculative_ocr = SpeculativeOCR()
+    speculation = st.session_state.speculative_ocr
+    full_boxes = scale_boxes(bbox_list or [], pil_image.size, full_image.size)
+    box_keys = [box_key(canvas_hash, bbox) for bbox in bbox_list or []]
+    # Removed or moved boxes are cancelled, new ones started
+    speculation.update(box_keys, lambda indices: submit_regions(
+        full_image, [full_boxes[i] for i in indices], temperature, *pdf_page))
 
     # user input for question
     user_input = st.chat_input('Tell me what you want to do with this question')
@@ -122,15 +171,13 @@ if canvas_result.json_data is not None:
         with st.status("Analyzing...", expanded=True) as status:
             # Run inference and generate response inside the expander
             st.write('Extracting math problems from the image... 🔍')
-            inferences = [infer_image(pil_image, bbox, temperature) for bbox in bbox_list]
-            st.write('Thinking and analyzing the math problems...')
-            time.sleep(2)
-
+            try:
+                # Usually finished already; waits only for boxes still running
+                inferences = speculation.gather(box_keys)
+            except OCRServiceBusy as e:
+                status.update(label=str(e), state="error")
+                st.stop()
             st.write('Generating the solution for the extracted problems... 💡')
-            solution = prompt_FP(user_input, inferences)
-            st.write('Calculating and generating the best solution...')
-            
-            fin_response = generate_response(solution)
 
             status.update(
                 label="Analysis Complete!", state="complete", expanded=False
@@ -143,6 +190,17 @@ if canvas_result.json_data is not None:
             st.markdown(katex_markdown)
             st.code(inference)
 
-        # Display the final solution outside of the expander
-        st.markdown(f"Solution: {fin_response}")
+        # Stream the final solution outside of the expander
+        st.markdown("Solution:")
+        timings = {}
+        solution = st.write_stream(cached_stream(prompt_FP, user_input, inferences, timings=timings))
+        st.caption(format_timings(timings))
+        get_history().add(session_owner(), user_input, "document", solution, latex=inferences, timings=timings, source="document")
         st.divider()
+
+        if show_breakdown:
+            with st.expander("Timing breakdown", expanded=True):
+                st.table(request_trace.rows())
+
+cache_stats = ocr_cache_stats()
+st.sidebar.caption(f"OCR cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
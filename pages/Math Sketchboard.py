@@ -6,9 +6,17 @@ import streamlit as st
 import numpy as np
 from PIL import Image
 from streamlit_drawable_canvas import st_canvas
-from utils.llm import generate_response
+from utils.llm import format_timings
 from utils.prompting import prompt_WB
-from utils.helper import process_whiteboard_image
+from utils.solutions import cached_stream
+from utils.helper import ocr_cache_stats
+from utils.whiteboard import recognize_board
+from utils.load_model import warm_up
+from utils.metrics import start_metrics_server, start_trace
+from utils.ocr_service import OCRServiceBusy
+
+# Canvas size in stroke coordinates
+CANVAS_WIDTH = 700
 
 
 def main():
@@ -38,7 +46,15 @@ def main():
 
 
     st.divider()
-    
+
+    # Start loading the model in the background while the user draws
+    warm_up()
+    start_metrics_server()
+
+    # Stage timings of this run, for the breakdown panel
+    request_trace = start_trace()
+    show_breakdown = st.sidebar.toggle("Show timing breakdown", value=False)
+
     st.markdown("""
     **Instructions:**
     1. Use the whiteboard below to draw a mathematical equation.
@@ -53,7 +69,7 @@ def main():
                                     stroke_color="#000000",  # Black stroke for clarity
                                     background_color="#FFFFFF",  # White background
                                     height=400,  # Adjust the canvas height for appropriate scaling (increase from 300)
-                                    width=700,  # Keep the width the same
+                                    width=CANVAS_WIDTH,  # Keep the width the same
                                     drawing_mode="freedraw",  # Allows freehand drawing (you can use 'rect' for bounding box)
                                     key="canvas",
                                 )
@@ -65,18 +81,39 @@ def main():
             # Convert the drawn canvas into an image and process it
             image = Image.fromarray(canvas_result.image_data.astype(np.uint8))
             
-            # Process the whiteboard image to extract the equation
-            problem = process_whiteboard_image(image)
+            # Only the lines drawn or changed since the last run are sent to the model
+            try:
+                problem, st.session_state.whiteboard_lines = recognize_board(
+                    image,
+                    canvas_result.json_data,
+                    previous=st.session_state.get("whiteboard_lines"),
+                    canvas_width=CANVAS_WIDTH,
+                )
+            except OCRServiceBusy as e:
+                st.error(str(e))
+                return
             
+            if not problem:
+                st.write("The whiteboard is empty. Please draw an equation first.")
+                return
+
             st.write("Detected problem:", problem)
             
             # Solve the detected math problem using the LLM
-            solution = prompt_WB(problem)
-            fin_response = generate_response(solution)
-            st.write("Solution:", fin_response)
+            st.write("Solution:")
+            timings = {}
+            st.write_stream(cached_stream(prompt_WB, problem, timings=timings))
+            st.caption(format_timings(timings))
+
+            if show_breakdown:
+                with st.expander("Timing breakdown", expanded=True):
+                    st.table(request_trace.rows())
         else:
             st.write("Please draw something on the whiteboard first.")
 
+    cache_stats = ocr_cache_stats()
+    st.sidebar.caption(f"OCR cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
 
 if __name__ == "__main__":
     main()
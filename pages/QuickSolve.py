@@ -1,30 +1,96 @@
-import scipy as sp
+import time
+
 import streamlit as st
-from utils.llm import generate_response
-from utils.helper import math_keyboard, render_latex
+from utils import settings
+from utils.llm import format_timings
+from utils.solutions import cached_stream, cached_submit, solution_cache_stats
+from utils.helper import render_latex
+from utils.history import get_history, session_owner
+from utils.keyboard import math_keyboard
 from utils.plotting import plot_function
+from utils.symbolic import solve_symbolic, format_steps, warm_up
+from utils.metrics import start_metrics_server, start_trace
 from utils.prompting import prompt_SQ, prompt_StepByStep
 
 
+def replay_entry(entry_id):
+    # Runs before the script, so the keyboard already shows the problem
+    entry = get_history().get(session_owner(), entry_id)
+    if entry is None:
+        return
+    st.session_state.replay = entry
+    if entry["source"] == "quicksolve":
+        st.session_state.math_input = entry["problem"]
+
+
+def show_replay(entry):
+    # A stored answer is shown as it was, without another LLM call
+    st.subheader("Solution (from history):")
+    for i, latex in enumerate(entry["latex"], start=1):
+        st.markdown(f"Extracted problem {i}:")
+        st.code(latex)
+    if entry["mode"] == "plot":
+        fig = plot_function(entry["problem"])
+        if fig:
+            st.pyplot(fig)
+    else:
+        st.markdown(entry["solution"] or "")
+    caption = "Replayed from history."
+    if entry["timings"]:
+        caption += f" Originally: {format_timings(entry['timings'])}"
+    st.caption(caption)
+
+
+def history_panel():
+    history = get_history()
+    owner = session_owner()
+    with st.expander("Problem History"):
+        # A new search starts again from the first page
+        query = st.text_input("Search past problems", key="history_query",
+                              on_change=lambda: st.session_state.update(history_page=1))
+        total = history.count(owner, query)
+        if not total:
+            st.write("No matching problems." if query.strip() else "No problems solved yet. Your history will appear here.")
+            return
+
+        page_size = settings.HISTORY_PAGE_SIZE
+        pages = -(-total // page_size)
+        # Only the current page is read from the database
+        page = 1
+        if pages > 1:
+            if st.session_state.get("history_page", 1) > pages:
+                st.session_state.history_page = pages
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="history_page")
+
+        for entry in history.page(owner, page - 1, page_size, query):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["created"]))
+            text_col, button_col = st.columns([5, 1])
+            with text_col:
+                st.write(entry['problem'])
+                st.caption(f"{when} · {entry['source']} · {entry['mode']}")
+            with button_col:
+                st.button("Replay", key=f"replay_{entry['id']}", help="Show the stored solution",
+                          on_click=replay_entry, args=(entry["id"],))
+
+
 def math_input_page():
 
 
     st.write("""
     Welcome to the Advanced Math Problem Solver! Here's how to use this app:
     1. Choose between 'Text Input' or 'LaTeX Input' tabs.
-    2. Use the Math Keyboard to easily input mathematical symbols.
+    2. Use the Math Keyboard to easily input mathematical symbols; it works in your browser, without reloading the page.
     3. Type your math problem or function in the input field.
     4. Click 'Solve' to get the solution or 'Plot Function' to visualize it.
-    5. You can view your problem history and adjust settings in the sidebar.
+    5. Search your problem history and replay a past solution instantly from the Problem History panel.
     """)
-    math_keyboard()
     # Tabs for different input methods
     tab1, tab2 = st.tabs(["Text Input", "LaTeX Input"])
 
     with tab1:
-        math_input = st.text_input("Enter your math problem:", value=st.session_state.get('math_input', ''),
-                                   help="Type or use the Math Keyboard to input your problem")
-        st.session_state.math_input = math_input
+        # Typing and symbol clicks stay in the browser: the script hears about
+        # the problem only when one of the keyboard's buttons is pressed
+        pressed = math_keyboard(value=st.session_state.get('math_input', ''))
 
     with tab2:
         latex_input = st.text_area("Enter LaTeX:", value=st.session_state.get('latex_input', ''),
@@ -34,55 +100,85 @@ def math_input_page():
             st.write("Preview:")
             st.write(render_latex(latex_input))
 
-    solve_col, plot_col, st_by_st = st.columns(3)
-    with solve_col:
-        solve_button = st.button("Solve", help="Click to solve the problem", use_container_width=True)
-    with plot_col:
-        plot_button = st.button("Plot Function", help="Click to plot the function", use_container_width=True)
-    with st_by_st:
-        st_by_st = st.button("Solve Step by step", help="Click to step by step with explanation", use_container_width=True)
-
-    input_to_solve = math_input if tab1 else latex_input
-    if input_to_solve:
-        if solve_button:
-            with st.spinner("Solving the problem..."):
-                solution = prompt_SQ(input_to_solve)
-                fin_response = generate_response(solution)
-                st.subheader("Solution:")
-                st.write(fin_response)
-
-        
-                # Offer step-by-step explanation
-        if st.button("Show step-by-step explanation"):
-            sp_by_sp = prompt_StepByStep(input_to_solve)
-            explanation = generate_response(sp_by_sp)
-            st.write(explanation)
-    else:
-        st.warning("Please enter a Math problem Above.")
-
-    if plot_button:
-        input_to_plot = math_input if tab1.active else latex_input
-        if input_to_plot:
-            fig = plot_function(input_to_plot)
-            if fig:
-                st.pyplot(fig)
+        solve_col, plot_col, st_by_st_col = st.columns(3)
+        with solve_col:
+            latex_solve = st.button("Solve", key="latex_solve", help="Click to solve the problem", use_container_width=True)
+        with plot_col:
+            latex_plot = st.button("Plot Function", key="latex_plot", help="Click to plot the function", use_container_width=True)
+        with st_by_st_col:
+            latex_steps = st.button("Solve Step by step", key="latex_steps", help="Click to step by step with explanation", use_container_width=True)
+
+    # The keyboard keeps returning its last press on later reruns, so each
+    # press is handled once, by its id
+    action = None
+    if pressed and pressed["id"] != st.session_state.get('keyboard_press'):
+        st.session_state.keyboard_press = pressed["id"]
+        action, input_to_solve = pressed["action"], pressed["text"].strip()
+    elif latex_solve or latex_plot or latex_steps:
+        action = "solve" if latex_solve else "plot" if latex_plot else "steps"
+        input_to_solve = latex_input.strip()
+
+    if action and not input_to_solve:
+        st.warning("Please enter a function to plot." if action == "plot" else "Please enter a Math problem Above.")
+        action = None
+    history = get_history()
+    owner = session_owner()
+    replay = st.session_state.pop('replay', None)
+    if replay and not action:
+        show_replay(replay)
+
+    if action in ("solve", "steps"):
+        # Remembered for the explanation button, which reruns the script
+        st.session_state.problem = input_to_solve
+
+    if action == "solve":
+        st.subheader("Solution:")
+        # Plain equations, derivatives, integrals and simplifications are
+        # answered locally by sympy; everything else goes to the LLM
+        with st.spinner("Solving the problem..."):
+            symbolic = solve_symbolic(input_to_solve)
+        if symbolic:
+            solution = format_steps(symbolic)
+            st.markdown(solution)
+            st.caption("Answered by: sympy (local)")
+            history.add(owner, input_to_solve, "symbolic", solution)
         else:
-            st.warning("Please enter a function to plot.")
+            # Start the step-by-step explanation in the background so it is
+            # ready if the user asks for it, while the solution streams in
+            st.session_state.explanation = (input_to_solve, cached_submit(prompt_StepByStep, input_to_solve))
+            timings = {}
+            solution = st.write_stream(cached_stream(prompt_SQ, input_to_solve, timings=timings))
+            st.caption(f"Answered by: LLM. {format_timings(timings)}")
+            history.add(owner, input_to_solve, "quick", solution, timings=timings)
+    elif action == "steps":
+        st.subheader("Step-by-step solution:")
+        timings = {}
+        solution = st.write_stream(cached_stream(prompt_StepByStep, input_to_solve, timings=timings))
+        st.caption(format_timings(timings))
+        history.add(owner, input_to_solve, "steps", solution, timings=timings)
+
+    # Offer step-by-step explanation
+    problem = st.session_state.get('problem')
+    if problem and action != "steps" and st.button("Show step-by-step explanation"):
+        cached_input, explanation = st.session_state.get('explanation', (None, None))
+        if cached_input == problem:
+            with st.spinner("Finishing the explanation..."):
+                solution = explanation.result()
+            st.write(solution)
+            history.add(owner, problem, "steps", solution)
+        else:
+            timings = {}
+            solution = st.write_stream(cached_stream(prompt_StepByStep, problem, timings=timings))
+            st.caption(format_timings(timings))
+            history.add(owner, problem, "steps", solution, timings=timings)
 
-    # History feature
-    if 'history' not in st.session_state:
-        st.session_state.history = []
+    if action == "plot":
+        fig = plot_function(input_to_solve)
+        if fig:
+            st.pyplot(fig)
+        history.add(owner, input_to_solve, "plot")
 
-    if solve_button or plot_button:
-        current_problem = math_input if tab1 else latex_input
-        st.session_state.history.append(current_problem)
-
-    with st.expander("Problem History"):
-        if st.session_state.history:
-            for i, problem in enumerate(st.session_state.history):
-                st.write(f"{i + 1}. {problem}")
-        else:
-            st.write("No problems solved yet. Your history will appear here.")
+    history_panel()
 
 
 def main():
@@ -113,9 +209,19 @@ def main():
         st.page_link('pages/Math Sketchboard.py', label='Math Sketchboard', icon="⬜")
 
     st.divider()
-    
+
+    # Start the sympy worker while the user types
+    warm_up()
+    start_metrics_server()
+
+    # Stage timings of this run, for the breakdown panel
+    request_trace = start_trace()
     math_input_page()
 
+    if st.sidebar.toggle("Show timing breakdown", value=False) and request_trace.stages:
+        with st.expander("Timing breakdown", expanded=True):
+            st.table(request_trace.rows())
+
     # Sidebar for settings and info
     with st.sidebar:
         
@@ -123,6 +229,11 @@ def main():
         st.info(
             "This app uses advanced AI to solve and explain mathematical problems. It can handle a wide range of topics including algebra, calculus, and more.")
 
+        cache_stats = solution_cache_stats()
+        st.caption(
+            f"Solution cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}), ~{cache_stats['saved_seconds']:.0f}s of LLM time saved")
+
         
 if __name__ == "__main__":
     main()
\ No newline at end of file
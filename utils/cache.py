@@ -0,0 +1,165 @@
+# ######################################################
+#                                                      #
+#        Cache primitives shared by the OCR and        #
+#                 solution pipelines.                  #
+#                                                      #
+# ######################################################
+
+
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class SQLiteStore:
+    """
+    Persistent key/value store backed by a single SQLite table.
+
+    Values are pickled, so anything picklable can be stored. The database is
+    opened in WAL mode so several Streamlit processes can share one file.
+    With max_entries, the least recently written rows are deleted once the
+    table grows past that size.
+    """
+
+    def __init__(self, path, table="cache", max_entries=None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", (key, blob)
+            )
+            if self.max_entries is not None:
+                # REPLACE assigns a fresh rowid, so rowid order is write order
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE rowid IN "
+                    f"(SELECT rowid FROM {self.table} ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional persistent backing store.
+
+    Lookups that miss in memory fall through to the store, and hits there are
+    promoted back into memory. Hit and miss counters cover both layers.
+    on_evict, if given, is called with (key, value) for every entry pushed
+    out of memory, e.g. to release resources held by the value. With a ttl
+    (in seconds), entries older than that are treated as missing in both
+    layers.
+    """
+
+    def __init__(self, maxsize=256, store=None, on_evict=None, ttl=None):
+        self.maxsize = maxsize
+        self.store = store
+        self.on_evict = on_evict
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, expires):
+        return expires is not None and expires <= time.time()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if not self._expired(expires):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        if self.store is not None:
+            value = self.store.get(key, _MISSING)
+            if value is not _MISSING:
+                # With a ttl the store holds (expires, value) pairs
+                expires = None
+                if self.ttl is not None:
+                    expires, value = value
+                if not self._expired(expires):
+                    with self._lock:
+                        self.hits += 1
+                        self._put(key, value, expires)
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._put(key, value, expires)
+        if self.store is not None:
+            self.store.set(key, value if self.ttl is None else (expires, value))
+
+    def _put(self, key, value, expires=None):
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted_key, (evicted, _) = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._data.items()]
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and not self._expired(entry[1])
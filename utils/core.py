@@ -0,0 +1,190 @@
+# ######################################################
+#                                                      #
+#      Streamlit-free API: extract LaTeX from images   #
+#      and PDFs, solve problems and plot functions.    #
+#                                                      #
+# ######################################################
+
+
+import io
+import os
+from collections import deque
+
+import pypdfium2
+from PIL import Image
+
+from utils.layout import propose_regions
+from utils.documents import PDFIUM_LOCK, text_in_boxes, looks_like_math
+from utils.helper import infer_crops, submit_crop, clean_text, MAX_BATCH_SIZE
+from utils.metrics import timed
+from utils.plot_engine import build_figure
+from utils.prompting import prompt_SQ, prompt_StepByStep
+from utils.solutions import cached_submit
+from utils.symbolic import solve_symbolic, format_steps
+
+# Ways a problem can be solved:
+#   quick    - sympy when it can answer, otherwise a short LLM solution
+#   steps    - a step-by-step explanation from the LLM
+#   symbolic - sympy only; fails if sympy cannot answer
+SOLVE_MODES = ("quick", "steps", "symbolic")
+
+# Crops of a PDF waiting for OCR at any one time; rendering pauses while
+# this many are outstanding, so memory does not grow with the document
+MAX_PENDING_CROPS = 2 * MAX_BATCH_SIZE
+
+_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def is_pdf(source):
+    # Paths are judged by extension, bytes and file objects by their header
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source).lower().endswith(".pdf")
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:5]) == b"%PDF-"
+    if hasattr(source, "read") and hasattr(source, "seek"):
+        position = source.tell()
+        header = source.read(5)
+        source.seek(position)
+        return header == b"%PDF-"
+    return False
+
+
+def is_image_file(path):
+    return os.path.splitext(path)[1].lower() in _IMAGE_EXTENSIONS
+
+
+def _pdf_regions(source, dpi, pages=None, text_layer=True):
+    # Yield (image, bbox, text) for every proposed region of the requested
+    # pages, rendered one at a time. text is None when the text layer is
+    # missing, unreadable or not used.
+    if hasattr(source, "read"):
+        source = source.read()
+    with PDFIUM_LOCK:
+        doc = pypdfium2.PdfDocument(source)
+        total = len(doc)
+    try:
+        for page_number in pages or range(1, total + 1):
+            with PDFIUM_LOCK:
+                page = doc[page_number - 1]
+                bitmap = page.render(scale=dpi / 72)
+                image = bitmap.to_pil().convert("RGB")
+                bitmap.close()
+            try:
+                regions = propose_regions(image)
+                texts = [None] * len(regions)
+                if text_layer:
+                    with PDFIUM_LOCK:
+                        texts = text_in_boxes(page, regions, image.size)
+            finally:
+                with PDFIUM_LOCK:
+                    page.close()
+            for bbox, text in zip(regions, texts):
+                yield image, bbox, clean_text(text) if text and looks_like_math(text) else None
+    finally:
+        with PDFIUM_LOCK:
+            doc.close()
+
+
+def _open_image(source):
+    if isinstance(source, Image.Image):
+        return source.convert("RGB")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return Image.open(source).convert("RGB")
+
+
+def _image_crops(image):
+    # Every proposed equation region, or the whole image if none is found
+    regions = propose_regions(image)
+    if not regions:
+        return [image]
+    return [image.crop(bbox) for bbox in regions]
+
+
+def extract(source, temperature=0.0, dpi=96, pages=None, text_layer=True):
+    """
+    Read the equations in an image or a PDF.
+
+    Parameters:
+    source: A path, bytes, a binary file object or a PIL image.
+    temperature (float): texify sampling temperature; 0 is deterministic.
+    dpi (int): Render resolution for PDF pages.
+    pages (list): 1-based PDF page numbers to read; all pages by default.
+    text_layer (bool): Read PDF regions from the text layer when it is
+                       usable, and OCR only the rest.
+
+    Returns:
+    list: The text or LaTeX of every detected region, in reading order.
+    """
+    if not is_pdf(source):
+        crops = _image_crops(_open_image(source))
+        return [latex for latex in infer_crops(crops, temperature) if latex]
+
+    # Crops go to the OCR service as each page is rendered, so OCR overlaps
+    # rendering and only a bounded number of crops is held at once
+    outputs, pending = [], deque()
+
+    def finish_oldest():
+        index, future = pending.popleft()
+        with timed("ocr_wait"):
+            outputs[index] = future.result()
+
+    for image, bbox, text in _pdf_regions(source, dpi, pages, text_layer):
+        outputs.append(text)
+        if text is None:
+            if len(pending) >= MAX_PENDING_CROPS:
+                finish_oldest()
+            pending.append((len(outputs) - 1, submit_crop(image.crop(bbox), temperature)))
+    while pending:
+        finish_oldest()
+    return [output for output in outputs if output]
+
+
+def solve(problem, mode="quick"):
+    """
+    Solve a problem given as text or LaTeX.
+
+    Parameters:
+    problem (str): The problem to solve.
+    mode (str): One of SOLVE_MODES.
+
+    Returns:
+    str: The answer as Markdown with LaTeX.
+
+    Raises:
+    ValueError: If the mode is unknown, or sympy cannot answer in symbolic mode.
+    RuntimeError: If the LLM call fails, or the sympy worker process cannot
+                  start (WorkerStartupError).
+    """
+    if mode not in SOLVE_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {', '.join(SOLVE_MODES)}")
+
+    if mode in ("quick", "symbolic"):
+        result = solve_symbolic(problem)
+        if result:
+            return format_steps(result)
+        if mode == "symbolic":
+            raise ValueError("sympy cannot answer this problem")
+
+    template = prompt_StepByStep if mode == "steps" else prompt_SQ
+    answer = cached_submit(template, problem).result()
+    if answer.startswith("Error:"):
+        raise RuntimeError(answer[len("Error:"):].strip())
+    return answer
+
+
+def plot(expression, x_range=(-10, 10), dpi=100):
+    """
+    Plot an equation or function given as text.
+
+    Returns:
+    bytes: The plot as a PNG image.
+
+    Raises:
+    sympy.SympifyError: If the text cannot be parsed.
+    ValueError: If there is nothing that can be drawn.
+    """
+    fig = build_figure(expression, x_range)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
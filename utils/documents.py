@@ -0,0 +1,326 @@
+# ######################################################
+#                                                      #
+#       Open PDF handles and rendered pages, kept      #
+#         per upload across Streamlit reruns.          #
+#                                                      #
+# ######################################################
+
+
+import os
+import atexit
+import hashlib
+import unicodedata
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import pypdfium2
+
+from utils import settings
+from utils.cache import LRUCache
+from utils.image_store import image_store
+
+# A glyph set smaller than this fraction of the tallest glyph in its box is
+# a sub- or superscript (or part of a fraction), which plain text flattens
+SCRIPT_RATIO = 0.85
+
+# pdfium is not thread-safe, even across different documents, so every
+# call into it goes through this lock
+PDFIUM_LOCK = threading.RLock()
+
+
+class DocumentHandle:
+    """
+    A parsed PDF that stays open while it is in the handle cache or in use.
+
+    The upload is spooled once to a temporary file and pdfium reads pages
+    from it on demand, so the bytes are neither copied into a new buffer nor
+    re-parsed on every rerun. Users pin the handle while they read from it;
+    one evicted from the cache is closed by its last user.
+    """
+
+    def __init__(self, digest, path):
+        self.digest = digest
+        self.path = path
+        self._users = 0
+        self._retired = False
+        self._lock = threading.Lock()
+        with PDFIUM_LOCK:
+            self.doc = pypdfium2.PdfDocument(path)
+            self.page_count = len(self.doc)
+
+    def pin(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and not self._users
+        if close:
+            self.close()
+
+    def retire(self):
+        # Out of the cache: close now if unused, otherwise on the last release
+        with self._lock:
+            self._retired = True
+            close = not self._users
+        if close:
+            self.close()
+
+    def render(self, page_num, dpi):
+        with PDFIUM_LOCK:
+            page = self.doc[page_num - 1]
+            bitmap = page.render(scale=dpi / 72)
+            image = bitmap.to_pil().convert("RGB")
+            bitmap.close()
+            page.close()
+        return image
+
+    def close(self):
+        with PDFIUM_LOCK:
+            self.doc.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _retire_handle(digest, handle):
+    handle.retire()
+
+
+# Content digest per upload, so the bytes are hashed only once per file
+_digests = LRUCache(maxsize=256)
+_handles = LRUCache(maxsize=settings.PDF_HANDLE_CACHE_SIZE, on_evict=_retire_handle)
+_handles_lock = threading.Lock()
+
+# Renders neighbouring pages in the background
+_prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-prefetch")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _hash_upload(upload):
+    with upload.getbuffer() as view:
+        return hashlib.blake2b(view, digest_size=16).hexdigest()
+
+
+def upload_digest(upload):
+    # Streamlit assigns each upload a stable file_id, so its bytes are hashed
+    # once. Plain file-like objects are hashed on every call: their id() is
+    # reused once they are freed, and their contents may change.
+    upload_id = getattr(upload, "file_id", None)
+    if upload_id is None:
+        return _hash_upload(upload)
+    digest = _digests.get(upload_id)
+    if digest is None:
+        digest = _hash_upload(upload)
+        _digests.set(upload_id, digest)
+    return digest
+
+
+def _pin_cached(digest):
+    # The cached handle for digest, pinned, or None
+    with _handles_lock:
+        handle = _handles.get(digest)
+        if handle is not None:
+            handle.pin()
+    return handle
+
+
+@contextmanager
+def open_document(upload):
+    """
+    The open handle of an upload, pinned for the duration of the block.
+
+    Eviction from the handle cache never closes a document inside the
+    block, so the handle must not be kept past it.
+    """
+    digest = upload_digest(upload)
+    with _handles_lock:
+        handle = _handles.get(digest)
+        if handle is None:
+            fd, path = tempfile.mkstemp(prefix="mathgpt-", suffix=".pdf")
+            with os.fdopen(fd, "wb") as tmp, upload.getbuffer() as view:
+                tmp.write(view)
+            handle = DocumentHandle(digest, path)
+            _handles.set(digest, handle)
+        handle.pin()
+    try:
+        yield handle
+    finally:
+        handle.release()
+
+
+def _render_cached(handle, page_num, dpi):
+    key = ("page", handle.digest, page_num, dpi)
+    image = image_store.get(key)
+    if image is not None:
+        return image
+
+    # If the prefetcher is already rendering this page, wait for it
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+    if future is not None:
+        image = future.result()
+        if image is not None:
+            return image
+
+    image = handle.render(page_num, dpi)
+    image_store.set(key, image)
+    return image
+
+
+def _prefetch(digest, page_count, page_num, dpi):
+    # Jobs find the handle by digest when they run, so they never hold on to
+    # one that has since been evicted
+    for offset in range(1, settings.PREFETCH_PAGES + 1):
+        for neighbour in (page_num + offset, page_num - offset):
+            key = ("page", digest, neighbour, dpi)
+            if not 1 <= neighbour <= page_count or key in image_store:
+                continue
+            with _in_flight_lock:
+                if key in _in_flight:
+                    continue
+                _in_flight[key] = _prefetcher.submit(_prefetch_page, digest, neighbour, dpi, key)
+
+
+def _prefetch_page(digest, page_num, dpi, key):
+    # None if the document is no longer open
+    try:
+        handle = _pin_cached(digest)
+        if handle is None:
+            return None
+        try:
+            image = handle.render(page_num, dpi)
+        finally:
+            handle.release()
+        image_store.set(key, image)
+        return image
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def render_page(upload, page_num, dpi=96):
+    with open_document(upload) as handle:
+        image = _render_cached(handle, page_num, dpi)
+        _prefetch(handle.digest, handle.page_count, page_num, dpi)
+    return image
+
+
+def page_count(upload):
+    with open_document(upload) as handle:
+        return handle.page_count
+
+
+def looks_like_math(text):
+    # Text from a PDF text layer is usable if there is some, and none of it
+    # is a glyph the font could not map to Unicode: replacement characters,
+    # private-use code points or control characters
+    characters = "".join(text.split())
+    if not characters:
+        return False
+    return not any(
+        c == "\ufffd" or unicodedata.category(c) in ("Co", "Cc", "Cn", "Cs")
+        for c in characters
+    )
+
+
+def is_linear(charboxes):
+    """
+    Whether glyphs sit on a single line at a single size, so their text needs
+    no layout to be read correctly.
+
+    Parameters:
+    charboxes (list): Loose (left, bottom, right, top) boxes of the glyphs.
+    """
+    glyphs = [box for box in charboxes if box[2] > box[0]]
+    if not glyphs:
+        return True
+    heights = [top - bottom for _, bottom, _, top in glyphs]
+    if min(heights) < SCRIPT_RATIO * max(heights):
+        return False
+    # Full-size glyphs stacked on top of each other, e.g. a numerator over a
+    # denominator, overlap horizontally
+    glyphs.sort()
+    for (left, _, right, _), (next_left, _, next_right, _) in zip(glyphs, glyphs[1:]):
+        narrower = min(right - left, next_right - next_left)
+        if right - next_left > narrower / 2:
+            return False
+    return True
+
+
+def text_in_boxes(page, bboxes, image_size):
+    """
+    Read the text layer of an open pdfium page inside each box.
+
+    The caller must hold PDFIUM_LOCK.
+
+    Parameters:
+    page (pypdfium2.PdfPage): The page.
+    bboxes (list): (left, top, right, bottom) boxes in the pixel coordinates
+                   of an image of the page, as rendered and resized for display.
+    image_size (tuple): (width, height) of that image.
+
+    Returns:
+    list: The text in each box. None where plain text cannot represent the
+          box (sub- and superscripts, fractions, several lines) and for
+          every box of a rotated page.
+    """
+    if page.get_rotation():
+        return [None] * len(bboxes)
+    # Rendering shows the crop box, whose origin need not be (0, 0); PDF
+    # y grows upwards while image y grows downwards
+    crop_left, crop_bottom, crop_right, crop_top = page.get_cropbox()
+    scale_x = image_size[0] / (crop_right - crop_left)
+    scale_y = image_size[1] / (crop_top - crop_bottom)
+    textpage = page.get_textpage()
+    try:
+        charboxes = [textpage.get_charbox(i, loose=True) for i in range(textpage.count_chars())]
+        texts = []
+        for left, top, right, bottom in bboxes:
+            rect = (
+                crop_left + left / scale_x,
+                crop_top - bottom / scale_y,
+                crop_left + right / scale_x,
+                crop_top - top / scale_y,
+            )
+            inside = [
+                box for box in charboxes
+                if rect[0] <= (box[0] + box[2]) / 2 <= rect[2] and rect[1] <= (box[1] + box[3]) / 2 <= rect[3]
+            ]
+            if not is_linear(inside):
+                texts.append(None)
+                continue
+            texts.append(textpage.get_text_bounded(left=rect[0], bottom=rect[1], right=rect[2], top=rect[3]))
+        return texts
+    finally:
+        textpage.close()
+
+
+def extract_text(upload, page_num, bboxes, image_size):
+    # Text layer inside each box of a displayed page image; see text_in_boxes
+    with open_document(upload) as handle, PDFIUM_LOCK:
+        page = handle.doc[page_num - 1]
+        try:
+            return text_in_boxes(page, bboxes, image_size)
+        finally:
+            page.close()
+
+
+def clear_cache():
+    # Close every document not in use and drop every stored image; those in
+    # use are closed by their last user
+    with _handles_lock:
+        _handles.clear()
+    image_store.clear()
+    _digests.clear()
+
+
+@atexit.register
+def _close_all():
+    _prefetcher.shutdown(wait=False, cancel_futures=True)
+    _handles.clear()
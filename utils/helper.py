@@ -6,102 +6,352 @@
 # ######################################################
 
 
-import io
+import os
 import hashlib
-import pypdfium2
+from concurrent.futures import Future, CancelledError, InvalidStateError
+import numpy as np
 from PIL import Image
-import streamlit as st
 import latex2mathml.converter
-from utils.symbols import MATH_SYMBOLS
-from texify.inference import batch_inference
-from texify.output import replace_katex_invalid
-from utils.load_model import load_modelANDprocessor
+from utils.load_model import model_identity
+from utils.ocr_service import get_ocr_service
+from utils.cache import LRUCache, SQLiteStore
+from utils.documents import open_document, render_page, upload_digest, extract_text, looks_like_math
+from utils.image_store import image_store
+from utils.layout import propose_regions, equation_regions, INK_THRESHOLD
+from utils.metrics import timed, count_cache, MODEL_CALLS
+from utils.singleflight import SingleFlight
+from utils import settings
 
 MAX_WIDTH = 800
 MAX_HEIGHT = 1000
 
-# Load the model and processor
-model, processor = load_modelANDprocessor()
+# Maximum number of crops sent to texify in a single forward pass
+MAX_BATCH_SIZE = settings.OCR_MAX_BATCH_SIZE
+
+# texify's processor shrinks every crop to fit this box (width, height)
+MODEL_INPUT_SIZE = (420, 420)
+
+# Blank margin, in pixels, kept around the ink when trimming a crop
+CROP_MARGIN = 4
+
+# Identity of the model that produced an OCR result; part of every cache key
+# so a texify upgrade never serves results from an older checkpoint
+MODEL_ID = model_identity()
+
+# Proposed equation regions per page, so flipping back to a page is free
+region_cache = LRUCache(maxsize=256)
+
+def _open_ocr_store():
+    if not settings.OCR_CACHE_DB:
+        return None
+    os.makedirs(os.path.dirname(settings.OCR_CACHE_DB) or ".", exist_ok=True)
+    return SQLiteStore(settings.OCR_CACHE_DB, table="ocr", max_entries=settings.OCR_CACHE_DISK_SIZE)
+
+
+# OCR results shared by every session in this process, optionally persisted
+ocr_cache = LRUCache(maxsize=settings.OCR_CACHE_SIZE, store=_open_ocr_store())
+
+# Crops being OCR'd right now, keyed like ocr_cache, so sessions that upload
+# the same worksheet at the same time share one inference per crop
+ocr_flight = SingleFlight("ocr")
 
 
 def render_latex(latex):
     return latex2mathml.converter.convert(latex)
 
-def symbol_button(symbol, key):
-    if st.button(symbol, key=key, help=f"Insert {symbol}"):
-        st.session_state.math_input = st.session_state.get('math_input', '') + symbol
 
-def math_keyboard():
-    st.write("**Math Keyboard**")
-    with st.expander('Math Keyboard Symbols'):
-        categories = list(MATH_SYMBOLS.keys())
-        tabs = st.tabs(categories)
+def ocr_cache_key(image, temperature):
+    # Content hash of the pixel buffer, so the same crop hits the cache no
+    # matter which page, upload or whiteboard it came from
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode}:{image.size}:{temperature}:{MODEL_ID}".encode())
+    return digest.hexdigest()
 
-        for tab, category in zip(tabs, categories):
-            with tab:
-                symbols = MATH_SYMBOLS[category]
-                cols = st.columns(8)
-                for i, symbol in enumerate(symbols):
-                    with cols[i % 8]:
-                        symbol_button(symbol, f"{category}_{symbol}")
+def ocr_cache_stats():
+    return ocr_cache.stats()
 
+def preprocess_crop(image):
+    # Trim a crop to its ink, convert it to grayscale and shrink it to the
+    # model input size in a single resampling step. Returns None if the crop
+    # has no ink at all, so blank input never reaches the model.
+    if image.mode in ("RGBA", "LA", "P"):
+        # Transparent pixels (e.g. an untouched whiteboard) are background
+        background = Image.new("RGBA", image.size, "white")
+        background.alpha_composite(image.convert("RGBA"))
+        image = background
+    gray = image.convert("L")
 
+    ink = np.asarray(gray) < INK_THRESHOLD
+    rows = np.flatnonzero(ink.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(ink.any(axis=0))
+    gray = gray.crop((
+        max(0, cols[0] - CROP_MARGIN),
+        max(0, rows[0] - CROP_MARGIN),
+        min(gray.width, cols[-1] + 1 + CROP_MARGIN),
+        min(gray.height, rows[-1] + 1 + CROP_MARGIN),
+    ))
 
-def infer_image(pil_image, bbox, temperature):
-    input_img = pil_image.crop(bbox)
-    model_output = batch_inference([input_img], model, processor, temperature=temperature)
-    return model_output[0]
+    scale = min(MODEL_INPUT_SIZE[0] / gray.width, MODEL_INPUT_SIZE[1] / gray.height)
+    if scale < 1:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        gray = gray.resize(size, Image.Resampling.LANCZOS)
+    return gray
+
+def infer_crops(crops, temperature):
+    # OCR the crops not already cached through the shared inference service,
+    # returning the outputs in the same order as crops. Blank crops come back
+    # as an empty string without a model call.
+    with timed("preprocess"):
+        crops = [preprocess_crop(crop) for crop in crops]
+        keys = [ocr_cache_key(crop, temperature) if crop is not None else None for crop in crops]
+    outputs = [ocr_cache.get(key) if key is not None else "" for key in keys]
+
+    pending = [i for i, output in enumerate(outputs) if output is None]
+    count_cache("ocr", hit=True, amount=sum(key is not None for key in keys) - len(pending))
+    count_cache("ocr", hit=False, amount=len(pending))
+    if not pending:
+        return outputs
+
+    with timed("ocr"):
+        while pending:
+            claims = [(i, *ocr_flight.claim(keys[i])) for i in pending]
+            _submit_claims(crops, keys, [(i, future) for i, future, leader in claims if leader], temperature)
+
+            # Crops whose inference was cancelled before finishing are tried again
+            retry = []
+            for i, future, _ in claims:
+                try:
+                    outputs[i] = future.result()
+                except CancelledError:
+                    retry.append(i)
+            pending = retry
+    return outputs
+
+def _submit_claims(crops, keys, claims, temperature):
+    # Send the crops this call leads to the OCR service. Results are cached
+    # as they arrive, even if the session that asked for them has moved on.
+    if not claims:
+        return []
+    MODEL_CALLS.inc(len(claims), model="texify")
+    try:
+        futures = get_ocr_service().submit_many([crops[i] for i, _ in claims], temperature)
+    except BaseException as e:
+        for i, future in claims:
+            ocr_flight.fail(keys[i], future, e)
+        raise
+    for (i, future), source in zip(claims, futures):
+        source.add_done_callback(
+            lambda f, key=keys[i]: f.cancelled() or f.exception() or ocr_cache.set(key, f.result())
+        )
+        ocr_flight.follow(keys[i], future, source)
+    return futures
+
+def _settle(future, value=None, exception=None):
+    # Complete a caller's future unless the caller already cancelled it
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(value)
+    except InvalidStateError:
+        pass
+
+def _claim_into(result, crop, key, temperature):
+    # Settle result from the in-flight OCR of key, starting it if nobody has
+    if result.done():
+        return
+    future, leader = ocr_flight.claim(key)
+    if leader:
+        try:
+            source, = _submit_claims([crop], [key], [(0, future)], temperature)
+        except Exception as e:
+            _settle(result, exception=e)
+            return
+        # Withdraw the crop from the queue if the caller gives up on it
+        result.add_done_callback(lambda r: r.cancelled() and source.cancel())
+
+    def copy(done):
+        if done.cancelled():
+            # The leader gave up; take over unless this caller did too
+            _claim_into(result, crop, key, temperature)
+        elif done.exception() is not None:
+            _settle(result, exception=done.exception())
+        else:
+            _settle(result, value=done.result())
+    future.add_done_callback(copy)
+
+def submit_crop(crop, temperature):
+    """
+    Start OCR of one crop without waiting for it.
 
-def open_pdf(pdf_file):
-    stream = io.BytesIO(pdf_file.getvalue())
-    return pypdfium2.PdfDocument(stream)
+    Returns:
+    Future: Resolves to the crop's LaTeX ("" for a blank crop). Cancelling it
+            withdraws the crop from the OCR queue if no worker has taken it
+            yet and no other session is waiting on the same crop.
+    """
+    result = Future()
+    with timed("preprocess"):
+        crop = preprocess_crop(crop)
+        key = ocr_cache_key(crop, temperature) if crop is not None else None
+    if key is None:
+        result.set_result("")
+        return result
+
+    cached = ocr_cache.get(key)
+    count_cache("ocr", hit=cached is not None)
+    if cached is not None:
+        result.set_result(cached)
+        return result
+    _claim_into(result, crop, key, temperature)
+    return result
+
+def submit_regions(pil_image, bbox_list, temperature, pdf_file=None, page_num=None):
+    """
+    Start reading every box without waiting, for speculative OCR.
+
+    PDF boxes with a usable text layer resolve right away; the rest go to
+    the OCR service.
+
+    Returns:
+    list: One Future per box, resolving to its text or LaTeX.
+    """
+    outputs = [None] * len(bbox_list)
+    if pdf_file is not None:
+        outputs = pdf_text_regions(pdf_file, page_num, pil_image.size, bbox_list)
+
+    futures = []
+    for bbox, output in zip(bbox_list, outputs):
+        if output is None:
+            futures.append(submit_crop(pil_image.crop(bbox), temperature))
+        else:
+            future = Future()
+            future.set_result(output)
+            futures.append(future)
+    return futures
+
+def infer_images(pil_image, bbox_list, temperature):
+    # Crop every box on the page and OCR them together
+    crops = [pil_image.crop(bbox) for bbox in bbox_list]
+    return infer_crops(crops, temperature)
+
+def clean_text(text):
+    # Collapse the line breaks and spacing of text-layer output
+    return " ".join(text.split())
+
+def pdf_text_regions(pdf_file, page_num, image_size, bbox_list):
+    # Text-layer reading of each box, or None where it has to be OCR'd
+    with timed("pdf_text"):
+        texts = extract_text(pdf_file, page_num, bbox_list, image_size)
+    outputs = [clean_text(text) if text and looks_like_math(text) else None for text in texts]
+
+    missing = sum(output is None for output in outputs)
+    count_cache("pdf_text", hit=True, amount=len(outputs) - missing)
+    count_cache("pdf_text", hit=False, amount=missing)
+    return outputs
+
+def infer_image(pil_image, bbox, temperature):
+    return infer_images(pil_image, [bbox], temperature)[0]
 
-@st.cache_data()
 def get_page_image(pdf_file, page_num, dpi=96):
-    doc = open_pdf(pdf_file)
-    renderer = doc.render(
-        pypdfium2.PdfBitmap.to_pil,
-        page_indices=[page_num - 1],
-        scale=dpi / 72,
-    )
-    png = list(renderer)[0]
-    png_image = png.convert("RGB")
-    return png_image
-
-@st.cache_data()
+    # Full-resolution render from the shared image store; treat it as read-only
+    with timed("pdf_render"):
+        return render_page(pdf_file, page_num, dpi)
+
 def get_uploaded_image(in_file):
-    return Image.open(in_file).convert("RGB")
+    # Decode each upload once into the shared image store; treat it as read-only
+    key = image_key(in_file)
+    image = image_store.get(key)
+    if image is None:
+        image = Image.open(in_file).convert("RGB")
+        image_store.set(key, image)
+    return image
+
+def image_key(upload, page_num=None, dpi=96):
+    # Image store key of an uploaded image, or of one page of an uploaded PDF
+    if page_num is None:
+        return ("upload", upload_digest(upload))
+    return ("page", upload_digest(upload), page_num, dpi)
 
-def resize_image(pil_image):
+def resize_image(pil_image, key=None):
+    """
+    Return a copy of the image that fits in MAX_WIDTH x MAX_HEIGHT for display.
+
+    The original is left untouched, so OCR can still crop it at full
+    resolution. If key (see image_key) is given, the display copy is kept in
+    the image store next to the original.
+    """
     if pil_image is None:
-        return
-    pil_image.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.Resampling.LANCZOS)
+        return None
+    scale = min(MAX_WIDTH / pil_image.width, MAX_HEIGHT / pil_image.height)
+    if scale >= 1:
+        return pil_image
+    display_key = ("display",) + key if key else None
+    if display_key:
+        display = image_store.get(display_key)
+        if display is not None:
+            return display
+    with timed("resize"):
+        size = (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale)))
+        display = pil_image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if display_key:
+        image_store.set(display_key, display)
+    return display
+
+def scale_boxes(bbox_list, from_size, to_size):
+    # Map (left, top, right, bottom) boxes between two sizes of the same image
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    return [
+        [left * scale_x, top * scale_y, right * scale_x, bottom * scale_y]
+        for left, top, right, bottom in bbox_list
+    ]
 
-@st.cache_data()
 def page_count(pdf_file):
-    doc = open_pdf(pdf_file)
-    return len(doc)
+    with timed("pdf_open"), open_document(pdf_file) as document:
+        return document.page_count
+
+def propose_page_regions(pil_image, page_key, pdf_file=None, page_num=None):
+    # Lines that look like equations, cached under page_key (e.g. the canvas
+    # hash). For PDF pages the text layer, where usable, decides which lines
+    # are math; the others are judged by their glyph shapes.
+    regions = region_cache.get(page_key)
+    if regions is None:
+        regions = propose_regions(pil_image)
+        texts = None
+        if pdf_file is not None and regions:
+            with timed("pdf_text"):
+                texts = extract_text(pdf_file, page_num, regions, pil_image.size)
+            texts = [text if text and looks_like_math(text) else None for text in texts]
+        regions = equation_regions(pil_image, regions, texts)
+        region_cache.set(page_key, regions)
+    return regions
+
+def regions_to_drawing(regions, fill_color, stroke_color):
+    # Initial drawing for st_canvas with one rectangle per proposed region
+    return {
+        "version": "4.4.0",
+        "objects": [
+            {
+                "type": "rect",
+                "left": left,
+                "top": top,
+                "width": right - left,
+                "height": bottom - top,
+                "fill": fill_color,
+                "stroke": stroke_color,
+                "strokeWidth": 1,
+            }
+            for left, top, right, bottom in regions
+        ],
+    }
 
 def get_canvas_hash(pil_image):
     return hashlib.md5(pil_image.tobytes()).hexdigest()
 
-@st.cache_data()
 def get_image_size(pil_image):
     if pil_image is None:
         return MAX_HEIGHT, MAX_WIDTH
     height, width = pil_image.height, pil_image.width
     return height, width
-
-@st.cache_data()
-def infer_whole_image(pil_image, temperature):
-    # Use the entire image for inference by setting bbox to the full image dimensions
-    bbox = (0, 0, pil_image.width, pil_image.height)
-    model_output = batch_inference([pil_image.crop(bbox)], model, processor, temperature=temperature)
-    return model_output[0]
-
-# Process whiteboard image function
-def process_whiteboard_image(image, temperature=0.7):
-    # Process the entire whiteboard image (no bounding box needed)
-    output = infer_whole_image(image, temperature)
-    extract_text = replace_katex_invalid(output)
-    return extract_text
\ No newline at end of file
@@ -0,0 +1,231 @@
+# ######################################################
+#                                                      #
+#      Problem history: every solved problem with its  #
+#      LaTeX, solution and timings, searchable and     #
+#             read back a page at a time.              #
+#                                                      #
+# ######################################################
+
+
+import os
+import re
+import json
+import uuid
+import time
+import sqlite3
+import threading
+
+from utils import settings
+
+_COLUMNS = ("id", "created", "source", "mode", "problem", "latex", "solution", "timings")
+
+# Owner ids are random hex tokens; anything else in a URL is replaced
+_OWNER_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def fts_query(text):
+    # Every word must match, as a prefix, so "deriv sin" finds
+    # "derivative of sin(x)"; quoting keeps FTS5 operators out of user input
+    words = text.split()
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+class HistoryStore:
+    """
+    Problem history in a SQLite table, newest first.
+
+    Every entry belongs to an owner (one browser), and every read is limited
+    to the owner asking, so users never see each other's problems.
+    Search uses an FTS5 index over the problem, LaTeX and solution when the
+    SQLite build has FTS5, and falls back to LIKE matching otherwise. Like
+    SQLiteStore, the database is opened in WAL mode and can be shared by
+    several processes. With max_entries, the oldest entries are deleted
+    once the table grows past that size.
+    """
+
+    def __init__(self, path=":memory:", max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, source TEXT NOT NULL, "
+            "mode TEXT NOT NULL, problem TEXT NOT NULL, latex TEXT, solution TEXT, timings TEXT, owner TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(history)")]
+        if "owner" not in columns:
+            # Entries from before owners existed have none, and are never shown
+            self._conn.execute("ALTER TABLE history ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS history_owner ON history (owner, id)")
+        self.fts = self._create_index()
+        self._conn.commit()
+
+    def _create_index(self):
+        # An external-content FTS5 table, kept in step with history by triggers
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING "
+                "fts5(problem, latex, solution, content='history', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            return False
+        self._conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                INSERT INTO history_fts (rowid, problem, latex, solution)
+                VALUES (new.id, new.problem, new.latex, new.solution);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                INSERT INTO history_fts (history_fts, rowid, problem, latex, solution)
+                VALUES ('delete', old.id, old.problem, old.latex, old.solution);
+            END;
+            CREATE TRIGGER IF NOT EXISTS history_au AFTER UPDATE ON history BEGIN
+                INSERT INTO history_fts (history_fts, rowid, problem, latex, solution)
+                VALUES ('delete', old.id, old.problem, old.latex, old.solution);
+                INSERT INTO history_fts (rowid, problem, latex, solution)
+                VALUES (new.id, new.problem, new.latex, new.solution);
+            END;
+        """)
+        return True
+
+    def add(self, owner, problem, mode, solution=None, latex=None, timings=None, source="quicksolve"):
+        """
+        Record a solved problem.
+
+        Parameters:
+        owner (str): Who solved it, from session_owner().
+        problem (str): The problem or request as the user gave it.
+        mode (str): How it was answered, e.g. 'quick', 'symbolic', 'steps' or 'plot'.
+        solution (str): The answer shown to the user, if any.
+        latex (list): LaTeX extracted from a document, if any.
+        timings (dict): Timings of the answer, as filled in by cached_stream.
+        source (str): The page the problem came from.
+
+        Returns:
+        int: The id of the new entry.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO history (owner, created, source, mode, problem, latex, solution, timings) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    owner, time.time(), source, mode, problem,
+                    json.dumps(latex, ensure_ascii=False) if latex else None,
+                    solution,
+                    json.dumps(timings, default=str) if timings else None,
+                ),
+            )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM history WHERE id IN "
+                    "(SELECT id FROM history ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def _where(self, owner, query):
+        # WHERE clause and parameters selecting the owner's entries that match query
+        if not query or not query.strip():
+            return "WHERE owner = ?", (owner,)
+        if self.fts:
+            return ("WHERE owner = ? AND id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)",
+                    (owner, fts_query(query)))
+        words = query.split()
+        pattern = "(problem LIKE ? ESCAPE '\\' OR latex LIKE ? ESCAPE '\\' OR solution LIKE ? ESCAPE '\\')"
+        params = [owner]
+        for word in words:
+            word = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params += [f"%{word}%"] * 3
+        return "WHERE owner = ? AND " + " AND ".join([pattern] * len(words)), tuple(params)
+
+    def count(self, owner, query=None):
+        where, params = self._where(owner, query)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+
+    def page(self, owner, number=0, page_size=10, query=None):
+        """
+        Read one page of the owner's entries, newest first.
+
+        Parameters:
+        owner (str): Whose entries to read.
+        number (int): 0-based page number.
+        page_size (int): Entries per page.
+        query (str): Only entries whose problem, LaTeX or solution contain
+                     every word of query.
+
+        Returns:
+        list: Entry dicts, as returned by get().
+        """
+        where, params = self._where(owner, query)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM history {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + (page_size, number * page_size),
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def get(self, owner, entry_id):
+        # None for entries of other owners, as for missing ones
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM history WHERE id = ? AND owner = ?", (entry_id, owner)
+            ).fetchone()
+        return _entry(row) if row else None
+
+    def clear(self, owner=None):
+        # Delete the owner's entries, or every entry
+        with self._lock:
+            if owner is None:
+                self._conn.execute("DELETE FROM history")
+            else:
+                self._conn.execute("DELETE FROM history WHERE owner = ?", (owner,))
+            self._conn.commit()
+
+
+def _entry(row):
+    entry = dict(zip(_COLUMNS, row))
+    entry["latex"] = json.loads(entry["latex"]) if entry["latex"] else []
+    entry["timings"] = json.loads(entry["timings"]) if entry["timings"] else {}
+    return entry
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    # The history shared by every session of this app, opened on first use
+    global _history
+    with _history_lock:
+        if _history is None:
+            path = settings.HISTORY_DB or ":memory:"
+            if settings.HISTORY_DB:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _history = HistoryStore(path, max_entries=settings.HISTORY_MAX_ENTRIES)
+    return _history
+
+
+def session_owner():
+    """
+    The history owner id of the current browser.
+
+    A random token is made once per session and mirrored in the page URL
+    (?history=...), so reloading or bookmarking the page keeps the same
+    history. Anyone with the URL can read that history, like a share link.
+    """
+    import streamlit as st
+
+    owner = st.session_state.get("history_owner")
+    if owner is None:
+        owner = st.query_params.get("history", "")
+        if not _OWNER_PATTERN.match(owner):
+            owner = uuid.uuid4().hex
+        st.session_state.history_owner = owner
+    if st.query_params.get("history") != owner:
+        # Page links drop the query string; put the token back
+        st.query_params["history"] = owner
+    return owner
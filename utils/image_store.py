@@ -0,0 +1,181 @@
+# ######################################################
+#                                                      #
+#     Byte-bounded store for rendered pages, uploads   #
+#     and thumbnails, shared by every session, with    #
+#          optional spill to PNG files on disk.        #
+#                                                      #
+# ######################################################
+
+
+import os
+import atexit
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from utils import settings
+
+
+def image_nbytes(image):
+    # Size of the decoded pixel buffer
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageStore:
+    """
+    LRU cache of PIL images bounded by their total decoded size.
+
+    Images evicted from memory are written to compressed PNG files in
+    spill_dir, themselves kept under max_spill_bytes in LRU order, and are
+    decoded back into memory on their next use. Stored images are shared
+    between callers and must not be modified in place.
+    """
+
+    def __init__(self, max_bytes, max_spill_bytes=0, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self.spill_dir = spill_dir
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._spill_path = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            spilled = self._disk.get(key)
+            if spilled is None:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+
+        try:
+            with Image.open(spilled[0]) as f:
+                image = f.copy()
+        except OSError:
+            self._drop_spilled(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.set(key, image)
+        return image
+
+    def set(self, key, image):
+        nbytes = image_nbytes(image)
+        if nbytes > self.max_bytes:
+            # Larger than the whole budget: the caller keeps its copy
+            return
+        evicted = []
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._memory[key] = (image, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                old_key, (old_image, old_nbytes) = self._memory.popitem(last=False)
+                self._bytes -= old_nbytes
+                evicted.append((old_key, old_image))
+        # PNG encoding happens outside the lock, so other sessions are not held up
+        for old_key, old_image in evicted:
+            self._spill(old_key, old_image)
+
+    def _spill_directory(self):
+        with self._lock:
+            if self._spill_path is None:
+                if self.spill_dir:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_path = tempfile.mkdtemp(prefix="mathgpt-images-", dir=self.spill_dir)
+                atexit.register(shutil.rmtree, self._spill_path, True)
+            return self._spill_path
+
+    def _spill(self, key, image):
+        if not self.max_spill_bytes:
+            return
+        with self._lock:
+            if key in self._disk:
+                # Still on disk from an earlier eviction
+                return
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest() + ".png"
+        path = os.path.join(self._spill_directory(), name)
+        try:
+            image.save(path, format="PNG", compress_level=1)
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        removed = []
+        with self._lock:
+            self._disk[key] = (path, size)
+            self._disk_bytes += size
+            while self._disk_bytes > self.max_spill_bytes:
+                _, (old_path, old_size) = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                removed.append(old_path)
+        for old_path in removed:
+            _remove(old_path)
+
+    def _drop_spilled(self, key):
+        with self._lock:
+            spilled = self._disk.pop(key, None)
+            if spilled is None:
+                return
+            self._disk_bytes -= spilled[1]
+        _remove(spilled[0])
+
+    def clear(self):
+        with self._lock:
+            paths = [path for path, _ in self._disk.values()]
+            self._memory.clear()
+            self._disk.clear()
+            self._bytes = 0
+            self._disk_bytes = 0
+        for path in paths:
+            _remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "images": len(self._memory),
+                "bytes": self._bytes,
+                "spilled_images": len(self._disk),
+                "spilled_bytes": self._disk_bytes,
+            }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Rendered PDF pages, decoded uploads and their display thumbnails for the
+# whole process, under one memory budget
+image_store = ImageStore(
+    max_bytes=settings.IMAGE_CACHE_BYTES,
+    max_spill_bytes=settings.IMAGE_SPILL_BYTES,
+    spill_dir=settings.IMAGE_SPILL_DIR,
+)
@@ -0,0 +1,47 @@
+# ######################################################
+#                                                      #
+#     Client-side math keyboard and problem input:     #
+#     symbols are typed in the browser, and the text   #
+#     reaches the script only on Solve or Plot.        #
+#                                                      #
+# ######################################################
+
+
+import os
+
+import streamlit.components.v1 as components
+
+# Static HTML/JS frontend; it speaks the component protocol directly, so
+# there is nothing to build. The symbol table lives in index.html, so it is
+# loaded once with the frame instead of being sent on every rerun.
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "math_keyboard")
+_component = components.declare_component("math_keyboard", path=_FRONTEND_DIR)
+
+# Actions the keyboard can send back, one per button
+KEYBOARD_ACTIONS = ("solve", "plot", "steps")
+
+
+def math_keyboard(value="", key="math_keyboard", placeholder="Enter your math problem"):
+    """
+    Render the problem input with its symbol keyboard.
+
+    Symbol clicks and typing stay in the browser; the script reruns only
+    when a Solve or Plot button is pressed (or Enter, which solves).
+
+    Parameters:
+    value (str): Text to show in the input. The browser keeps its own edits
+                 across reruns; a different value replaces them.
+    key (str): Streamlit widget key.
+    placeholder (str): Hint shown in the empty input.
+
+    Returns:
+    dict: {'text', 'action', 'id'} for the last button pressed, or None
+          before the first press. 'id' changes on every press, so the same
+          action on the same text can be told apart from a plain rerun.
+    """
+    return _component(
+        value=value,
+        placeholder=placeholder,
+        key=key,
+        default=None,
+    )
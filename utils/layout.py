@@ -0,0 +1,164 @@
+# ######################################################
+#                                                      #
+#       Page layout analysis used to propose the       #
+#        regions of a page that should be OCR'd.       #
+#                                                      #
+# ######################################################
+
+
+import re
+import unicodedata
+
+import numpy as np
+
+# Pixels darker than this are treated as ink
+INK_THRESHOLD = 200
+
+# Glyph shapes are measured against the median glyph height of the region:
+# a glyph raised by more than this above the baseline is a superscript
+RAISED_FRACTION = 0.35
+
+# Raised marks shorter than this are quotes and apostrophes, not exponents
+MIN_SCRIPT_FRACTION = 0.5
+
+# Glyphs at least this many times the median height are big operators (∫, ∑)
+TALL_FACTOR = 2.0
+
+
+def _spans(mask, min_gap):
+    # Return [start, end) spans of True values, bridging gaps shorter than min_gap
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1]).reshape(-1, 2)
+    spans = []
+    for start, end in edges:
+        if spans and start - spans[-1][1] < min_gap:
+            spans[-1][1] = int(end)
+        else:
+            spans.append([int(start), int(end)])
+    return spans
+
+
+def propose_regions(pil_image, padding=4, min_size=8):
+    """
+    Propose bounding boxes for the text and equation lines on a page.
+
+    Rows containing ink are grouped into lines with a horizontal projection
+    profile, then each line is split on wide horizontal gaps so that inline
+    blocks (e.g. an equation and its number) become separate regions.
+
+    Parameters:
+    pil_image (PIL.Image): The rendered page.
+    padding (int): Margin in pixels added around each region.
+    min_size (int): Regions smaller than this in either direction are dropped as noise.
+
+    Returns:
+    list: Bounding boxes as [left, top, right, bottom], in reading order.
+    """
+    ink = np.asarray(pil_image.convert("L")) < INK_THRESHOLD
+    height, width = ink.shape
+    row_gap = max(2, height // 300)
+    col_gap = max(12, width // 30)
+
+    regions = []
+    for top, bottom in _spans(ink.any(axis=1), row_gap):
+        if bottom - top < min_size:
+            continue
+        for left, right in _spans(ink[top:bottom].any(axis=0), col_gap):
+            if right - left < min_size:
+                continue
+            regions.append([
+                max(0, left - padding),
+                max(0, top - padding),
+                min(width, right + padding),
+                min(height, bottom + padding),
+            ])
+    return regions
+
+
+def _glyphs(ink):
+    # Columns of ink separated by blank columns, roughly one glyph each, as
+    # (left, right, top, bottom, vertical runs)
+    glyphs = []
+    for left, right in _spans(ink.any(axis=0), 1):
+        runs = _spans(ink[:, left:right].any(axis=1), 1)
+        glyphs.append((left, right, runs[0][0], runs[-1][1], runs))
+    return glyphs
+
+
+def _has_bar(ink):
+    # A row in the top quarter inked across nearly the whole width, like the
+    # bar of a square root; touching letters of a word leave gaps
+    rows = ink[:max(1, len(ink) // 4)]
+    return bool(rows.size) and bool((rows.mean(axis=1) >= 0.8).any())
+
+
+def looks_like_equation(ink):
+    """
+    Whether a proposed region looks like mathematics rather than prose, from
+    the shapes of its glyphs.
+
+    Prose is a row of glyphs of similar height on one baseline. A region is
+    taken as math if it has stacked material (fractions, ÷), an equals sign,
+    a raised superscript, an outsized glyph (∫, ∑) or a bar over several
+    glyphs (√, overlines).
+
+    Parameters:
+    ink (np.ndarray): Boolean ink mask of the region.
+    """
+    glyphs = _glyphs(ink)
+    if not glyphs:
+        return False
+    heights = np.array([bottom - top for _, _, top, bottom, _ in glyphs])
+    median = max(float(np.median(heights)), 1.0)
+    baseline = float(np.median([bottom for _, _, _, bottom, _ in glyphs]))
+
+    for (left, right, top, bottom, runs), height in zip(glyphs, heights):
+        width = right - left
+        if len(runs) >= 3:
+            # Numerator, bar and denominator
+            return True
+        if len(runs) == 2 and all(3 * (end - start) <= width for start, end in runs):
+            # Two thin bars: an equals sign
+            return True
+        if bottom < baseline - RAISED_FRACTION * median and height >= MIN_SCRIPT_FRACTION * median:
+            return True
+        if height >= TALL_FACTOR * median:
+            return True
+        if height >= 0.8 * median and width >= 2 * height and _has_bar(ink[top:bottom, left:right]):
+            return True
+    return False
+
+
+def equation_regions(pil_image, regions, texts=None):
+    """
+    Keep the regions that look like equations, dropping headings and prose.
+
+    Parameters:
+    pil_image (PIL.Image): The page the regions were proposed on.
+    regions (list): [left, top, right, bottom] boxes from propose_regions.
+    texts (list): Optional text-layer reading of each region, or None where
+                  there is none; a region with text is judged by that text.
+
+    Returns:
+    list: The regions kept, in their original order.
+    """
+    ink = np.asarray(pil_image.convert("L")) < INK_THRESHOLD
+    texts = texts or [None] * len(regions)
+    kept = []
+    for (left, top, right, bottom), text in zip(regions, texts):
+        if text is not None:
+            if mentions_math(text):
+                kept.append([left, top, right, bottom])
+        elif looks_like_equation(ink[top:bottom, left:right]):
+            kept.append([left, top, right, bottom])
+    return kept
+
+
+# Operators that mark a line of text as math; the Unicode math symbols
+# (category Sm) count too
+_MATH_TEXT = re.compile(r"[\^*/²³]|\d\s*-|-\s*\d|\s-\s")
+
+
+def mentions_math(text):
+    # Whether text-layer text contains an operator or relation
+    return any(unicodedata.category(c) == "Sm" for c in text) or bool(_MATH_TEXT.search(text))
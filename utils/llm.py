@@ -1,18 +1,61 @@
-import g4f
-from g4f.client import Client
+import time
 
+from utils.llm_client import get_client
+from utils.metrics import record, MODEL_CALLS, LLM_ERRORS
 
-def generate_response(problem: str) -> str:
+
+async def _safe_complete(client, problem):
+    MODEL_CALLS.inc(model="llm")
+    start = time.perf_counter()
     try:
-        client = Client()
-        response = client.chat.completions.create(
-            model=g4f.models.gpt_4,
-            messages=[{'role': 'user', 'content': problem }]
-        )
-        return response.choices[0].message.content
+        return await client.acomplete(problem)
     except Exception as e:
+        LLM_ERRORS.inc()
         return f"Error: {str(e)}"
+    finally:
+        record("llm", time.perf_counter() - start)
 
-# the AI/ML API not Accept more input token its way we used the free llm
+
+def submit_response(problem: str):
+    # Start generating in the background and return a Future for the answer
+    client = get_client()
+    return client.submit(_safe_complete(client, problem))
+
+
+def stream_response(problem: str, timings: dict = None):
+    """
+    Yield the answer to a prompt chunk by chunk as the model produces it.
+
+    Parameters:
+    problem (str): The prompt to send.
+    timings (dict): Optional dict that receives 'ttft' (seconds to the first chunk),
+                    'total' (seconds for the whole answer) and 'error' if the call failed.
+    """
+    timings = {} if timings is None else timings
+    MODEL_CALLS.inc(model="llm")
+    start = time.perf_counter()
+    try:
+        for chunk in get_client().stream(problem):
+            if 'ttft' not in timings:
+                timings['ttft'] = time.perf_counter() - start
+                record("llm_first_token", timings['ttft'])
+            yield chunk
+    except Exception as e:
+        LLM_ERRORS.inc()
+        timings['error'] = str(e)
+        yield f"Error: {str(e)}"
+    finally:
+        timings['total'] = time.perf_counter() - start
+        record("llm", timings['total'])
 
 
+def format_timings(timings: dict) -> str:
+    if timings.get('cached'):
+        return "Served from the solution cache"
+    if timings.get('shared'):
+        return f"Shared with an identical request, ready after {timings['total']:.2f}s"
+    if 'ttft' not in timings:
+        return f"Generated in {timings.get('total', 0):.2f}s"
+    return f"First token after {timings['ttft']:.2f}s, generated in {timings['total']:.2f}s"
+
+# the AI/ML API not Accept more input token its way we used the free llm
@@ -0,0 +1,151 @@
+# ######################################################
+#                                                      #
+#      Asynchronous LLM client shared by all pages     #
+#               and sessions in a process.             #
+#                                                      #
+# ######################################################
+
+
+import queue
+import random
+import asyncio
+import threading
+
+import g4f
+from g4f.client import AsyncClient
+
+from utils import settings
+
+
+class LLMClient:
+    """
+    Asyncio LLM client with a single reused g4f client.
+
+    All requests run on one background event loop, so they can be issued
+    concurrently from any thread. A semaphore caps how many are in flight,
+    each attempt has its own timeout, and failed attempts are retried with
+    exponential backoff. complete() and stream() are blocking wrappers for
+    the Streamlit script thread.
+    """
+
+    def __init__(self, model=None, max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                 timeout=settings.LLM_TIMEOUT, retries=settings.LLM_RETRIES, backoff=1.0, client=None):
+        self.model = model or g4f.models.gpt_4
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # Any object with an async chat.completions.create() in the g4f/OpenAI
+        # shape can stand in for the g4f client, e.g. in the benchmarks
+        self._client = client or AsyncClient()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    async def _backoff(self, attempt):
+        # Exponential backoff with a little jitter so retries don't line up
+        await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 4))
+
+    async def acomplete(self, prompt):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await asyncio.wait_for(
+                        self._client.chat.completions.create(
+                            model=self.model,
+                            messages=[{'role': 'user', 'content': prompt}],
+                        ),
+                        self.timeout,
+                    )
+                    return response.choices[0].message.content
+                except Exception:
+                    if attempt == self.retries:
+                        raise
+                    await self._backoff(attempt)
+
+    async def astream(self, prompt):
+        # Yield the answer chunk by chunk. Failures are only retried before the
+        # first chunk arrives; after that the partial answer has been shown.
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                started = False
+                try:
+                    response = await asyncio.wait_for(
+                        self._client.chat.completions.create(
+                            model=self.model,
+                            messages=[{'role': 'user', 'content': prompt}],
+                            stream=True,
+                        ),
+                        self.timeout,
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            return
+                        content = chunk.choices[0].delta.content
+                        if content:
+                            started = True
+                            yield content
+                except Exception:
+                    if started or attempt == self.retries:
+                        raise
+                    await self._backoff(attempt)
+
+    def submit(self, coro):
+        # Schedule a coroutine on the client loop; returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def complete(self, prompt):
+        return self.run(self.acomplete(prompt))
+
+    def stream(self, prompt):
+        # Blocking generator over astream(), safe to consume from any thread
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(prompt):
+                    chunks.put(chunk)
+            except BaseException as e:
+                chunks.put(e)
+                raise
+            finally:
+                chunks.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is done:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            # Stop generating if the consumer goes away early
+            future.cancel()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+    return _client
@@ -1,7 +1,164 @@
-from texify.model.model import load_model
-from texify.model.processor import load_processor
-import streamlit as st
+import os
+import threading
+import importlib.metadata
+
+from utils import settings
+
+_model_and_processor = None
+_lock = threading.Lock()
+
 
-@st.cache_resource()
 def load_modelANDprocessor():
-    return load_model(), load_processor()
+    # texify (and torch with it) is imported and loaded on first use only;
+    # every later call in the process returns the same model and processor
+    global _model_and_processor
+    if _model_and_processor is None:
+        with _lock:
+            if _model_and_processor is None:
+                from texify.model.model import load_model
+                from texify.model.processor import load_processor
+                _model_and_processor = load_model(), load_processor()
+    return _model_and_processor
+
+
+def _generation_kwargs(processor, temperature):
+    # Same decoding settings as texify.inference.batch_inference
+    from texify.settings import settings as texify_settings
+    kwargs = {
+        "max_new_tokens": texify_settings.MAX_TOKENS,
+        "decoder_start_token_id": processor.tokenizer.bos_token_id,
+    }
+    if temperature > 0:
+        kwargs.update(temperature=temperature, do_sample=True, top_p=0.95)
+    return kwargs
+
+
+class TorchBackend:
+    """Full-precision PyTorch model, as loaded by texify."""
+
+    name = "torch"
+
+    def __init__(self):
+        self.model, self.processor = load_modelANDprocessor()
+
+    def infer(self, images, temperature):
+        from texify.inference import batch_inference
+        return batch_inference(images, self.model, self.processor, temperature=temperature)
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """texify with its Linear layers dynamically quantized to int8, for CPU inference."""
+
+    name = "int8"
+
+    def __init__(self):
+        import torch
+        from texify.model.model import load_model
+        from texify.model.processor import load_processor
+
+        model = load_model(device="cpu", dtype=torch.float32)
+        self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.processor = load_processor()
+
+
+class ONNXBackend:
+    """
+    texify exported to ONNX and run with ONNX Runtime.
+
+    The first load exports the checkpoint to ONNX_MODEL_DIR, which takes a
+    few minutes; later loads reuse the export. Requires optimum[onnxruntime].
+    """
+
+    name = "onnx"
+
+    def __init__(self):
+        try:
+            from optimum.onnxruntime import ORTModelForVision2Seq
+        except ImportError as e:
+            raise ImportError("The onnx OCR backend requires optimum[onnxruntime]") from e
+        from transformers import AutoModel
+        from texify.settings import settings as texify_settings
+        from texify.model.config import VariableDonutSwinConfig, get_config
+        from texify.model.model import VariableDonutSwinModel
+        from texify.model.processor import load_processor
+
+        # texify's encoder is a custom architecture that must be registered
+        # before transformers/optimum can instantiate it
+        AutoModel.register(VariableDonutSwinConfig, VariableDonutSwinModel, exist_ok=True)
+        if os.path.isdir(settings.ONNX_MODEL_DIR):
+            self.model = ORTModelForVision2Seq.from_pretrained(settings.ONNX_MODEL_DIR)
+        else:
+            checkpoint = texify_settings.MODEL_CHECKPOINT
+            self.model = ORTModelForVision2Seq.from_pretrained(
+                checkpoint, config=get_config(checkpoint), export=True
+            )
+            self.model.save_pretrained(settings.ONNX_MODEL_DIR)
+        self.processor = load_processor()
+
+    def infer(self, images, temperature):
+        from texify.output import postprocess
+        images = [image.convert("RGB") for image in images]
+        encodings = self.processor(images=images, return_tensors="pt", add_special_tokens=False)
+        generated_ids = self.model.generate(
+            pixel_values=encodings["pixel_values"],
+            **_generation_kwargs(self.processor, temperature),
+        )
+        generated_text = self.processor.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+        return [postprocess(text) for text in generated_text]
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    ONNXBackend.name: ONNXBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def load_backend(name=None):
+    """
+    Return the inference backend with the given name, loading it on first use.
+
+    Every backend exposes infer(images, temperature) -> list of LaTeX strings.
+
+    Parameters:
+    name (str): One of BACKENDS; defaults to settings.OCR_BACKEND.
+    """
+    name = name or settings.OCR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend {name!r}; choose from {', '.join(BACKENDS)}")
+    if name not in _backends:
+        with _backends_lock:
+            if name not in _backends:
+                _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+def is_loaded():
+    return settings.OCR_BACKEND in _backends
+
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def warm_up():
+    # Load the backend on a background thread so the first OCR request doesn't
+    # wait, unless MATHGPT_WARMUP_MODEL=0. Pages call this on every rerun; only
+    # the first call starts a thread.
+    global _warm_up_thread
+    if not settings.WARMUP_MODEL or is_loaded():
+        return
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=load_backend, name="texify-warmup", daemon=True)
+            _warm_up_thread.start()
+
+
+def model_identity():
+    # Checkpoint, texify version and backend, known without importing torch or
+    # loading the model; texify reads MODEL_CHECKPOINT from the environment
+    checkpoint = os.environ.get("MODEL_CHECKPOINT", "vikp/texify")
+    return f"{checkpoint}:{importlib.metadata.version('texify')}:{settings.OCR_BACKEND}"
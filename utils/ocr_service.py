@@ -0,0 +1,146 @@
+# ######################################################
+#                                                      #
+#       OCR inference service shared by every          #
+#        Streamlit session in the process.             #
+#                                                      #
+# ######################################################
+
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from utils import settings
+from utils.load_model import load_backend
+
+
+class OCRServiceBusy(RuntimeError):
+    """Raised when the OCR queue stays full for longer than the submit timeout."""
+
+
+def size_buckets(images, max_batch_size):
+    # Group images of similar area together so a batch is not held back by
+    # one large crop that decodes a much longer sequence than the others
+    order = sorted(range(len(images)), key=lambda i: images[i].width * images[i].height)
+    for start in range(0, len(order), max_batch_size):
+        yield order[start:start + max_batch_size]
+
+
+def texify_infer(images, temperature):
+    # The backend (and torch with it) is loaded on the first call only
+    return load_backend().infer(images, temperature)
+
+
+class OCRService:
+    """
+    Worker threads that own texify inference for the whole process.
+
+    Sessions submit crops and get a Future back. A worker takes the first
+    waiting request, then keeps collecting for batch_window seconds (or until
+    the batch is full), so crops from different sessions that arrive together
+    share one batch_inference call. A bounded queue provides backpressure:
+    submit() blocks while it is full and raises OCRServiceBusy if no room
+    frees up in time. torch_threads sets torch's intra-op thread count,
+    which is one setting for the whole process, not per worker.
+    """
+
+    def __init__(self, infer=texify_infer, workers=settings.OCR_WORKERS,
+                 max_batch_size=settings.OCR_MAX_BATCH_SIZE, batch_window=settings.OCR_BATCH_WINDOW,
+                 queue_size=settings.OCR_QUEUE_SIZE, torch_threads=settings.TORCH_THREADS,
+                 submit_timeout=settings.OCR_SUBMIT_TIMEOUT):
+        self.infer = infer
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.torch_threads = torch_threads
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._torch_configured = False
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f"ocr-worker-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, image, temperature):
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((image, temperature, future), timeout=self.submit_timeout)
+        except queue.Full:
+            raise OCRServiceBusy("The OCR service is busy, please try again in a moment")
+        return future
+
+    def submit_many(self, images, temperature):
+        return [self.submit(image, temperature) for image in images]
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        # Block for the first request, then gather more until the window closes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Requests cancelled while queued are dropped here
+        return [item for item in batch if item[2].set_running_or_notify_cancel()]
+
+    def _configure_torch(self):
+        # Process-wide, so it is applied once rather than by every worker
+        with self._start_lock:
+            if self.torch_threads > 0 and not self._torch_configured:
+                import torch
+                torch.set_num_threads(self.torch_threads)
+                self._torch_configured = True
+
+    def _run(self):
+        self._configure_torch()
+
+        while True:
+            batch = self._collect()
+            by_temperature = {}
+            for item in batch:
+                by_temperature.setdefault(item[1], []).append(item)
+
+            for temperature, items in by_temperature.items():
+                images = [image for image, _, _ in items]
+                for indices in size_buckets(images, self.max_batch_size):
+                    try:
+                        outputs = self.infer([images[i] for i in indices], temperature)
+                    except Exception as e:
+                        for i in indices:
+                            items[i][2].set_exception(e)
+                        continue
+                    for i, output in zip(indices, outputs):
+                        items[i][2].set_result(output)
+
+
+_service = None
+_service_lock = threading.Lock()
+_service_options = {}
+
+
+def configure_ocr_service(**options):
+    # Override OCRService arguments; only has an effect before the first OCR call
+    _service_options.update(options)
+
+
+def get_ocr_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = OCRService(**_service_options)
+    return _service
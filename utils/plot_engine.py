@@ -0,0 +1,278 @@
+# ######################################################
+#                                                      #
+#       Plotting engine: adaptive sampling for         #
+#     explicit curves, contouring for implicit ones.   #
+#                                                      #
+# ######################################################
+
+
+import numpy as np
+import sympy as sp
+from matplotlib.figure import Figure
+
+from utils import settings
+from utils.cache import LRUCache
+from utils.metrics import count_cache
+from utils.symbolic import parse_equation, worker
+
+x, y = sp.symbols('x y')
+
+# Points per branch on the first, uniform pass
+INITIAL_POINTS = 200
+
+# Upper bound on points per branch, whatever the curvature
+MAX_POINTS = 4000
+
+# Refinement passes; each one can at most double the points in a region
+MAX_DEPTH = 8
+
+# Midpoint error, relative to the visible y-range, that triggers refinement
+TOLERANCE = 1e-3
+
+# A jump bigger than this fraction of the visible y-range between two
+# neighbouring samples is drawn as a break rather than a line
+JUMP_FRACTION = 0.5
+
+# Grid resolution for implicit relations
+GRID_POINTS = 300
+
+# Most solution branches drawn for one equation
+MAX_BRANCHES = 8
+
+
+# Parsed equations, solution branches and compiled callables, keyed by the
+# normalized input and shared by every session in the process
+expression_cache = LRUCache(maxsize=settings.EXPRESSION_CACHE_SIZE)
+
+
+def compile_expression(expr, args):
+    # NumPy callable for a sympy expression
+    return sp.lambdify(args, expr, "numpy")
+
+
+def _evaluate(f, *arrays):
+    with np.errstate(all="ignore"):
+        values = np.asarray(f(*arrays))
+    if values.shape != arrays[0].shape:
+        # Constant expressions come back as a scalar
+        values = np.broadcast_to(values, arrays[0].shape)
+    if np.iscomplexobj(values):
+        real = values.real.astype(float)
+        real[np.abs(values.imag) > 1e-9] = np.nan
+        values = real
+    values = np.array(values, dtype=float)
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+
+def _y_scale(ys):
+    finite = ys[np.isfinite(ys)]
+    if finite.size < 2:
+        return 1.0
+    low, high = np.percentile(finite, [5, 95])
+    return max(high - low, 1e-9)
+
+
+def sample_adaptive(f, x_range):
+    """
+    Sample f on x_range, adding points where the curve bends or breaks.
+
+    Each pass evaluates the midpoint of every interval at once and splits the
+    intervals whose midpoint is far from the straight line between their ends,
+    or where the function is undefined at either end.
+
+    Returns:
+    tuple: (xs, ys) arrays, with NaN at discontinuities so lines break there.
+    """
+    xs = np.linspace(x_range[0], x_range[1], INITIAL_POINTS)
+    ys = _evaluate(f, xs)
+    scale = _y_scale(ys)
+
+    for _ in range(MAX_DEPTH):
+        budget = MAX_POINTS - xs.size
+        if budget <= 0:
+            break
+        mids = (xs[:-1] + xs[1:]) / 2
+        mid_ys = _evaluate(f, mids)
+        linear = (ys[:-1] + ys[1:]) / 2
+        with np.errstate(invalid="ignore"):
+            error = np.abs(mid_ys - linear)
+        undefined = np.isnan(ys[:-1]) != np.isnan(ys[1:])
+        refine = np.flatnonzero((error > TOLERANCE * scale) | undefined)
+        if refine.size == 0:
+            break
+        if refine.size > budget:
+            # Spend the remaining budget on the worst intervals
+            worst = np.argsort(np.nan_to_num(error[refine], nan=np.inf))[::-1][:budget]
+            refine = np.sort(refine[worst])
+        xs = np.insert(xs, refine + 1, mids[refine])
+        ys = np.insert(ys, refine + 1, mid_ys[refine])
+
+    return split_discontinuities(xs, ys, scale)
+
+
+def split_discontinuities(xs, ys, scale):
+    # A large jump between neighbours that survives refinement is a pole or
+    # a step; put a NaN between them so matplotlib lifts the pen
+    with np.errstate(invalid="ignore"):
+        jumps = np.flatnonzero(np.abs(np.diff(ys)) > JUMP_FRACTION * scale)
+    if jumps.size == 0:
+        return xs, ys
+    breaks = (xs[jumps] + xs[jumps + 1]) / 2
+    return np.insert(xs, jumps + 1, breaks), np.insert(ys, jumps + 1, np.nan)
+
+
+def implicit_grid(f, x_range, y_range):
+    # Evaluate f(x, y) on a grid; its zero contour is the curve
+    xs = np.linspace(x_range[0], x_range[1], GRID_POINTS)
+    ys = np.linspace(y_range[0], y_range[1], GRID_POINTS)
+    X, Y = np.meshgrid(xs, ys)
+    return X, Y, _evaluate(f, X, Y)
+
+
+def solve_branches(eq):
+    """
+    Split an equation into the pieces that can be drawn.
+
+    Returns:
+    tuple: (kind, items), where kind is 'y' (items are y = f(x) branches),
+           'x' (items are x = c vertical lines) or 'implicit' (items is the
+           single expression whose zero set is the curve).
+    """
+    relation = eq.lhs - eq.rhs
+    if y not in eq.free_symbols:
+        if eq.rhs == 0 and eq.lhs.free_symbols <= {x}:
+            # A bare expression such as "1/x" is read as y = expression
+            return 'y', [eq.lhs]
+        try:
+            solutions = [s for s in sp.solve(eq, x) if s.is_real]
+        except (NotImplementedError, ValueError):
+            return 'implicit', [relation]
+        return 'x', solutions[:MAX_BRANCHES]
+
+    try:
+        solutions = sp.solve(eq, y)
+    except (NotImplementedError, ValueError):
+        solutions = []
+    solutions = [s for s in solutions if s.free_symbols <= {x}]
+    if not solutions:
+        return 'implicit', [relation]
+    return 'y', solutions[:MAX_BRANCHES]
+
+
+def prepare_plot(text):
+    # Parse and solve in one trip to the sympy worker
+    eq = parse_equation(text)
+    return (eq,) + solve_branches(eq)
+
+
+def compile_plot(func_str):
+    """
+    Parse, solve and compile an equation, or fetch it from the expression cache.
+
+    Parsing and solving run in the sympy worker process under
+    PLOT_SOLVE_TIMEOUT, since parsing evaluates the input too ("9**9**9").
+    If that takes longer, the equation is parsed alone and drawn as an
+    implicit curve; if even parsing takes longer, it is rejected.
+
+    Raises:
+    sp.SympifyError: If the text cannot be parsed.
+    ValueError: If the text takes too long to parse.
+
+    Returns:
+    dict: 'equation', 'kind' and 'items' as returned by solve_branches, and
+          'functions', the compiled NumPy callables for the items.
+    """
+    key = " ".join(func_str.split())
+    entry = expression_cache.get(key)
+    count_cache("expression", hit=entry is not None)
+    if entry is not None:
+        return entry
+
+    timeout = settings.PLOT_SOLVE_TIMEOUT
+    try:
+        eq, kind, items = worker.run(prepare_plot, key, timeout=timeout)
+    except TimeoutError:
+        try:
+            eq = worker.run(parse_equation, key, timeout=timeout)
+        except TimeoutError:
+            raise ValueError(f"{func_str} takes too long to evaluate")
+        kind, items = 'implicit', [eq.lhs - eq.rhs]
+
+    if kind == 'implicit':
+        functions = [compile_expression(items[0], (x, y))]
+    elif kind == 'y':
+        functions = [compile_expression(item, (x,)) for item in items]
+    else:
+        functions = []
+
+    entry = {"equation": eq, "kind": kind, "items": items, "functions": functions}
+    expression_cache.set(key, entry)
+    return entry
+
+
+def draw_branches(ax, entry, x_range):
+    kind, items, functions = entry["kind"], entry["items"], entry["functions"]
+    if kind == 'implicit':
+        X, Y, Z = implicit_grid(functions[0], x_range, x_range)
+        if np.all(np.isnan(Z)):
+            raise ValueError("The equation is undefined everywhere in the plotted range")
+        # matplotlib contours the zero level with marching squares
+        ax.contour(X, Y, Z, levels=[0], colors='C0')
+        ax.plot([], [], color='C0', label=f'Implicit: {sp.pretty(items[0])} = 0')
+        return
+
+    if kind == 'x':
+        for solution in items:
+            ax.axvline(float(solution), color='C0', label=f'Solution: x = {sp.pretty(solution)}')
+        return
+
+    uniform = np.linspace(x_range[0], x_range[1], INITIAL_POINTS)
+    visible = []
+    for solution, f in zip(items, functions):
+        xs, ys = sample_adaptive(f, x_range)
+        ax.plot(xs, ys, label=f'Solution: {sp.pretty(solution)}')
+        # Limits come from a uniform sample, since refinement piles up points near poles
+        values = _evaluate(f, uniform)
+        visible.append(values[np.isfinite(values)])
+
+    values = np.concatenate(visible)
+    if values.size == 0:
+        raise ValueError("The function has no real values in the plotted range")
+
+    # Keep poles from flattening the rest of the curve
+    low, high = np.percentile(values, [2, 98])
+    if high > low:
+        pad = (high - low) * 0.2
+        ax.set_ylim(low - pad, high + pad)
+
+
+def build_figure(func_str, x_range=(-10, 10)):
+    """
+    Plot an equation or function given as text.
+
+    Raises:
+    sp.SympifyError: If the text cannot be parsed.
+    ValueError: If there is nothing that can be drawn.
+    """
+    entry = compile_plot(func_str)
+    if not entry["items"]:
+        raise ValueError(f"No real solutions to plot for {func_str}")
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    draw_branches(ax, entry, x_range)
+
+    # Add title and labels
+    ax.set_title(f"Plot of {func_str}")
+    ax.set_xlabel('x')
+    ax.set_ylabel('y')
+    ax.set_xlim(*x_range)
+    ax.grid(True)
+
+    # Add x and y axis lines for better visibility
+    ax.axhline(y=0, color='k', linestyle='-', linewidth=0.5)
+    ax.axvline(x=0, color='k', linestyle='-', linewidth=0.5)
+    ax.legend()
+
+    return fig
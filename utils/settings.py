@@ -0,0 +1,140 @@
+# ######################################################
+#                                                      #
+#      Runtime settings for the application. Every     #
+#      value can be overridden from the environment.   #
+#                                                      #
+# ######################################################
+
+
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Number of OCR results kept in memory
+OCR_CACHE_SIZE = _env_int("MATHGPT_OCR_CACHE_SIZE", 1024)
+
+# SQLite file that persists OCR results across restarts and processes.
+# Leave unset to keep the cache in memory only.
+OCR_CACHE_DB = os.environ.get("MATHGPT_OCR_CACHE_DB") or None
+
+# Number of OCR results kept in the on-disk cache
+OCR_CACHE_DISK_SIZE = _env_int("MATHGPT_OCR_CACHE_DISK_SIZE", 50000)
+
+# Number of uploaded PDFs kept open and parsed at the same time
+PDF_HANDLE_CACHE_SIZE = _env_int("MATHGPT_PDF_HANDLE_CACHE_SIZE", 8)
+
+# Memory budget, in bytes of decoded pixels, for rendered PDF pages, uploaded
+# images and their display thumbnails across all sessions
+IMAGE_CACHE_BYTES = _env_int("MATHGPT_IMAGE_CACHE_BYTES", 256 * 2**20)
+
+# Disk budget for images evicted from memory, kept as PNG files; 0 turns
+# spilling off
+IMAGE_SPILL_BYTES = _env_int("MATHGPT_IMAGE_SPILL_BYTES", 1024 * 2**20)
+
+# Directory for spilled images; a fresh temporary directory is made in it
+# (or in the system temp directory) and removed on exit
+IMAGE_SPILL_DIR = os.environ.get("MATHGPT_IMAGE_SPILL_DIR") or None
+
+# How many pages on each side of the current one are rendered ahead of time
+PREFETCH_PAGES = _env_int("MATHGPT_PREFETCH_PAGES", 1)
+
+# Maximum number of LLM requests in flight at once across all sessions
+LLM_MAX_CONCURRENCY = _env_int("MATHGPT_LLM_MAX_CONCURRENCY", 4)
+
+# Seconds before a single LLM request is abandoned
+LLM_TIMEOUT = _env_int("MATHGPT_LLM_TIMEOUT", 120)
+
+# Extra attempts for a failed LLM request, with exponential backoff
+LLM_RETRIES = _env_int("MATHGPT_LLM_RETRIES", 2)
+
+# Number of LLM solutions kept in memory
+SOLUTION_CACHE_SIZE = _env_int("MATHGPT_SOLUTION_CACHE_SIZE", 512)
+
+# Number of LLM solutions kept in the on-disk cache
+SOLUTION_CACHE_DISK_SIZE = _env_int("MATHGPT_SOLUTION_CACHE_DISK_SIZE", 20000)
+
+# Seconds before a cached solution is generated again
+SOLUTION_CACHE_TTL = _env_int("MATHGPT_SOLUTION_CACHE_TTL", 7 * 24 * 3600)
+
+# SQLite file shared by every session and process. Set to an empty
+# string to keep solutions in memory only.
+SOLUTION_CACHE_DB = os.environ.get(
+    "MATHGPT_SOLUTION_CACHE_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "mathgpt", "solutions.sqlite3"),
+) or None
+
+# SQLite file holding the problem history (problems, LaTeX, solutions and
+# timings). Set to an empty string to keep the history in memory only.
+HISTORY_DB = os.environ.get(
+    "MATHGPT_HISTORY_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "mathgpt", "history.sqlite3"),
+) or None
+
+# Number of history entries kept; the oldest are deleted past this
+HISTORY_MAX_ENTRIES = _env_int("MATHGPT_HISTORY_MAX_ENTRIES", 10000)
+
+# History entries shown per page
+HISTORY_PAGE_SIZE = _env_int("MATHGPT_HISTORY_PAGE_SIZE", 10)
+
+# Seconds the local sympy solver may spend before the LLM takes over
+SYMBOLIC_TIMEOUT = _env_float("MATHGPT_SYMBOLIC_TIMEOUT", 2.0)
+
+# sympy worker processes shared by every session (solving and plotting), so
+# one slow problem does not make everyone else wait
+SYMBOLIC_WORKERS = _env_int("MATHGPT_SYMBOLIC_WORKERS", 2)
+
+# Number of parsed and compiled plot expressions kept in memory
+EXPRESSION_CACHE_SIZE = _env_int("MATHGPT_EXPRESSION_CACHE_SIZE", 256)
+
+# Seconds sympy may spend solving a plotted equation for y before the
+# equation is drawn as an implicit curve instead
+PLOT_SOLVE_TIMEOUT = _env_float("MATHGPT_PLOT_SOLVE_TIMEOUT", 2.0)
+
+# Start loading the texify model in the background when the first page loads,
+# so the first OCR request does not wait for it
+WARMUP_MODEL = os.environ.get("MATHGPT_WARMUP_MODEL", "1") != "0"
+
+# Threads running texify inference; each one takes batches off a shared queue
+OCR_WORKERS = _env_int("MATHGPT_OCR_WORKERS", 1)
+
+# torch intra-op threads for the whole process, shared by every OCR worker
+# (torch has no per-thread setting); 0 leaves torch's default. With several
+# workers, keep workers x threads at or below the number of cores.
+TORCH_THREADS = _env_int("MATHGPT_TORCH_THREADS", 0)
+
+# Maximum number of crops sent to texify in a single forward pass
+OCR_MAX_BATCH_SIZE = _env_int("MATHGPT_OCR_MAX_BATCH_SIZE", 8)
+
+# Seconds a worker waits for more requests to fill a batch
+OCR_BATCH_WINDOW = _env_float("MATHGPT_OCR_BATCH_WINDOW", 0.02)
+
+# Crops waiting for a worker before new requests are turned away
+OCR_QUEUE_SIZE = _env_int("MATHGPT_OCR_QUEUE_SIZE", 64)
+
+# Seconds a request waits for room in a full queue before it is rejected
+OCR_SUBMIT_TIMEOUT = _env_float("MATHGPT_OCR_SUBMIT_TIMEOUT", 5.0)
+
+# texify inference backend: "torch" (full precision), "int8" (dynamically
+# quantized PyTorch) or "onnx" (ONNX Runtime, needs optimum[onnxruntime])
+OCR_BACKEND = os.environ.get("MATHGPT_OCR_BACKEND", "torch")
+
+# Where the exported ONNX model is kept between runs
+ONNX_MODEL_DIR = os.environ.get(
+    "MATHGPT_ONNX_MODEL_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mathgpt", "texify-onnx"),
+)
+
+# Port of the Prometheus /metrics endpoint; 0 turns it off
+METRICS_PORT = _env_int("MATHGPT_METRICS_PORT", 9464)
+
+# Interface the metrics endpoint listens on; use 0.0.0.0 to allow remote scrapes
+METRICS_HOST = os.environ.get("MATHGPT_METRICS_HOST", "127.0.0.1")
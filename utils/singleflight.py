@@ -0,0 +1,128 @@
+# ######################################################
+#                                                      #
+#      Single-flight: concurrent identical requests    #
+#       share one in-flight computation.               #
+#                                                      #
+# ######################################################
+
+
+import threading
+from concurrent.futures import Future, CancelledError, InvalidStateError
+
+from utils.metrics import COALESCED
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that have the same key.
+
+    The first caller for a key (the leader) runs the computation; callers
+    that arrive while it is in flight wait on the leader's Future instead of
+    starting their own. Errors reach every waiter, but nothing is remembered
+    once the call finishes: caching results is left to the caller. If the
+    leader gives up (its Future is cancelled), waiters start over, and one
+    of them becomes the new leader.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """
+        Join the call for key, or start one.
+
+        Returns:
+        tuple: (future, leader). A leader must settle the future with
+               resolve(), fail(), cancel() or follow().
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                COALESCED.inc(flight=self.name)
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def resolve(self, key, future, result):
+        # Waiters see the result before the key is released, so a caller that
+        # arrives in between still gets it instead of starting over. A future
+        # cancelled in the meantime keeps its state.
+        try:
+            future.set_result(result)
+        except InvalidStateError:
+            pass
+        self._forget(key, future)
+
+    def fail(self, key, future, exception):
+        try:
+            future.set_exception(exception)
+        except InvalidStateError:
+            pass
+        self._forget(key, future)
+
+    def cancel(self, key, future):
+        # Waiters get CancelledError and retry
+        self._forget(key, future)
+        future.cancel()
+
+    def follow(self, key, future, source):
+        # Settle future the same way as the concurrent Future source
+        def copy(done):
+            if done.cancelled():
+                self.cancel(key, future)
+            elif done.exception() is not None:
+                self.fail(key, future, done.exception())
+            else:
+                self.resolve(key, future, done.result())
+        source.add_done_callback(copy)
+
+    def do(self, key, fn, *args):
+        """
+        Return fn(*args), sharing the call with concurrent callers of the same key.
+
+        Exceptions raised by fn reach every caller. If the leader is
+        interrupted (e.g. a Streamlit rerun stops its script), the others retry.
+        """
+        while True:
+            future, leader = self.claim(key)
+            if not leader:
+                try:
+                    return future.result()
+                except CancelledError:
+                    continue
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.fail(key, future, e)
+                raise
+            except BaseException:
+                self.cancel(key, future)
+                raise
+            self.resolve(key, future, result)
+            return result
+
+    def share(self, key, start):
+        """
+        Future-based variant of do(): start() returns a concurrent Future,
+        and every concurrent caller of the same key gets a Future for its result.
+        """
+        future, leader = self.claim(key)
+        if leader:
+            try:
+                source = start()
+            except BaseException as e:
+                self.fail(key, future, e)
+                raise
+            self.follow(key, future, source)
+        return future
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,216 @@
+# ######################################################
+#                                                      #
+#      Persistent cache of LLM solutions, keyed by     #
+#       prompt template and normalized problem.        #
+#                                                      #
+# ######################################################
+
+
+import os
+import re
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, CancelledError
+
+import sympy as sp
+from sympy.parsing.sympy_parser import parse_expr, standard_transformations, convert_xor
+
+from utils import settings
+from utils.cache import LRUCache, SQLiteStore
+from utils.llm import stream_response, submit_response
+from utils.metrics import timed, count_cache
+from utils.singleflight import SingleFlight
+
+# Longest input that is canonicalized through sympy; anything longer is
+# almost certainly prose and only gets whitespace/LaTeX normalization
+MAX_SYMPY_LENGTH = 200
+
+# LaTeX commands that only affect spacing or sizing
+_LATEX_NOISE = re.compile(r"\\(left|right|displaystyle|textstyle|[,;:! ]|quad|qquad)(?![a-zA-Z])")
+
+# Large or stacked exponents that sympy would try to evaluate eagerly
+_HUGE_POWER = re.compile(r"(\^|\*\*)\s*\(?\s*\d{3,}|(\^|\*\*)[^+\-=]*(\^|\*\*)")
+
+_TRANSFORMATIONS = standard_transformations + (convert_xor,)
+
+# Input that canonical_problem hands to sympy: digits, lowercase names,
+# operators and brackets only
+_SAFE_CHARS = re.compile(r"^[0-9a-z .+\-*/^()=,]*$")
+_SAFE_FUNCTIONS = {
+    "sin", "cos", "tan", "cot", "sec", "csc", "asin", "acos", "atan",
+    "sinh", "cosh", "tanh", "log", "ln", "exp", "sqrt", "pi",
+}
+
+
+def _open_store():
+    if not settings.SOLUTION_CACHE_DB:
+        return None
+    os.makedirs(os.path.dirname(settings.SOLUTION_CACHE_DB) or ".", exist_ok=True)
+    return SQLiteStore(settings.SOLUTION_CACHE_DB, table="solutions",
+                       max_entries=settings.SOLUTION_CACHE_DISK_SIZE)
+
+
+solution_cache = LRUCache(
+    maxsize=settings.SOLUTION_CACHE_SIZE,
+    ttl=settings.SOLUTION_CACHE_TTL,
+    store=_open_store(),
+)
+
+# Answers being generated right now, keyed like solution_cache, so identical
+# requests from different sessions wait for one LLM call
+llm_flight = SingleFlight("llm")
+
+# Generation time avoided by cache hits, for the hit-rate metrics
+_saved = {"seconds": 0.0, "calls": 0}
+_saved_lock = threading.Lock()
+
+
+def normalize_problem(text):
+    # Drop math delimiters and spacing commands, then collapse whitespace
+    text = str(text).replace("$", " ")
+    text = _LATEX_NOISE.sub(" ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _safe_for_sympy(text):
+    # parse_expr runs eval(), and calls such as diff() or integrate() compute
+    # their result even with evaluate=False, so only plain arithmetic on
+    # one-letter variables and elementary functions is parsed
+    if not _SAFE_CHARS.match(text):
+        return False
+    return all(len(name) == 1 or name in _SAFE_FUNCTIONS for name in re.findall(r"[a-z]+", text))
+
+
+def _parse_unevaluated(text):
+    # Sorts the terms of sums and products but never computes a value
+    return sp.srepr(parse_expr(text, transformations=_TRANSFORMATIONS, evaluate=False))
+
+
+def canonical_problem(text):
+    """
+    Return a canonical form of a problem so equivalent inputs share a cache entry.
+
+    Plain expressions and equations are parsed with sympy without evaluating
+    them, so "1 + x" and "x+1", or "x^2" and "x**2", collide, while "2+2"
+    and "4" stay different problems. Anything else falls back to the
+    normalized text.
+    """
+    normalized = normalize_problem(text)
+    if (not normalized or len(normalized) > MAX_SYMPY_LENGTH or _HUGE_POWER.search(normalized)
+            or not _safe_for_sympy(normalized)):
+        return normalized
+    try:
+        if normalized.count("=") == 1:
+            left, right = normalized.split("=")
+            return "Eq:" + _parse_unevaluated(left) + "=" + _parse_unevaluated(right)
+        return "Expr:" + _parse_unevaluated(normalized)
+    except Exception:
+        return normalized
+
+
+def solution_key(template_id, *parts):
+    digest = hashlib.blake2b(template_id.encode(), digest_size=16)
+    for part in parts:
+        items = part if isinstance(part, (list, tuple)) else [part]
+        for item in items:
+            digest.update(b"\x1f" + canonical_problem(item).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _lookup(key):
+    entry = solution_cache.get(key)
+    count_cache("solution", hit=entry is not None)
+    if entry is None:
+        return None
+    with _saved_lock:
+        _saved["seconds"] += entry["seconds"]
+        _saved["calls"] += 1
+    return entry["answer"]
+
+
+def _store(key, answer, seconds):
+    if answer and not answer.startswith("Error:"):
+        solution_cache.set(key, {"answer": answer, "seconds": seconds})
+
+
+def cached_stream(template, *args, timings=None):
+    """
+    Stream the answer for template(*args), serving it from the solution cache when possible.
+
+    Parameters:
+    template (function): A prompt builder from utils.prompting; its name identifies the template.
+    args: The problem parts passed to the template.
+    timings (dict): Optional dict filled like utils.llm.stream_response, plus
+                    'cached' or 'shared' when no new LLM call was made.
+    """
+    timings = {} if timings is None else timings
+    key = solution_key(template.__name__, *args)
+    answer = _lookup(key)
+    if answer is not None:
+        timings.update(cached=True, ttft=0.0, total=0.0)
+        yield answer
+        return
+
+    # If the same problem is already being answered, wait for that answer
+    start = time.perf_counter()
+    while True:
+        future, leader = llm_flight.claim(key)
+        if leader:
+            break
+        try:
+            answer = future.result()
+        except CancelledError:
+            continue
+        elapsed = time.perf_counter() - start
+        timings.update(shared=True, ttft=elapsed, total=elapsed)
+        yield answer
+        return
+
+    chunks = []
+    try:
+        with timed("prompt"):
+            prompt = template(*args)
+        for chunk in stream_response(prompt, timings):
+            chunks.append(chunk)
+            yield chunk
+    except BaseException:
+        # Includes the consumer closing the stream early; waiters retry
+        llm_flight.cancel(key, future)
+        raise
+    answer = "".join(chunks)
+    if "error" not in timings:
+        _store(key, answer, timings["total"])
+    llm_flight.resolve(key, future, answer)
+
+
+def cached_submit(template, *args):
+    # Like utils.llm.submit_response, but resolved immediately on a cache hit
+    key = solution_key(template.__name__, *args)
+    answer = _lookup(key)
+    if answer is not None:
+        future = Future()
+        future.set_result(answer)
+        return future
+
+    def start():
+        with timed("prompt"):
+            prompt = template(*args)
+        started = time.perf_counter()
+        future = submit_response(prompt)
+        future.add_done_callback(
+            lambda f: f.cancelled() or _store(key, f.result(), time.perf_counter() - started)
+        )
+        return future
+
+    # Identical requests in flight share one Future
+    return llm_flight.share(key, start)
+
+
+def solution_cache_stats():
+    stats = solution_cache.stats()
+    with _saved_lock:
+        stats["saved_seconds"] = _saved["seconds"]
+        stats["saved_calls"] = _saved["calls"]
+    return stats
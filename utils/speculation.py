@@ -0,0 +1,67 @@
+# ######################################################
+#                                                      #
+#      Speculative OCR: boxes are read while they are  #
+#      drawn, before the user says what to do.         #
+#                                                      #
+# ######################################################
+
+
+from utils.metrics import timed
+
+
+class SpeculativeOCR:
+    """
+    One session's in-flight readings, keyed by box.
+
+    update() is called on every rerun with the boxes currently on the
+    canvas: boxes that are new get started, boxes that were removed (or
+    moved, which gives them a new key) get cancelled. When the request
+    arrives, gather() only waits for whatever is still running.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def update(self, keys, start):
+        """
+        Parameters:
+        keys (list): A hashable key per box on the canvas.
+        start (callable): Takes the indices of the boxes to read and returns
+                          a Future per index.
+        """
+        wanted = set(keys)
+        for key in [key for key in self._futures if key not in wanted]:
+            self._futures.pop(key).cancel()
+
+        # Boxes not started yet, and those that failed (e.g. the OCR queue
+        # was full) get another try
+        missing, seen = [], set()
+        for i, key in enumerate(keys):
+            future = self._futures.get(key)
+            failed = future is not None and future.done() and future.exception() is not None
+            if (future is None or failed) and key not in seen:
+                missing.append(i)
+                seen.add(key)
+        if missing:
+            for i, future in zip(missing, start(missing)):
+                self._futures[keys[i]] = future
+
+    def gather(self, keys):
+        # Results in the order of keys; re-raises the error of a failed box
+        with timed("ocr_wait"):
+            return [self._futures[key].result() for key in keys]
+
+    def pending(self):
+        return sum(not future.done() for future in self._futures.values())
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+
+def box_key(page_key, bbox, precision=1):
+    # Canvas coordinates are floats; rounding keeps a box that has not moved
+    # on the same key from one rerun to the next
+    return (page_key, tuple(round(v, precision) for v in bbox))
+
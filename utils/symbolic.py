@@ -0,0 +1,376 @@
+# ######################################################
+#                                                      #
+#      Local sympy solver that answers plain math      #
+#         problems before falling back to the LLM.     #
+#                                                      #
+# ######################################################
+
+
+import re
+import queue
+import threading
+import multiprocessing
+
+import sympy as sp
+from sympy.parsing.sympy_parser import (
+    parse_expr,
+    standard_transformations,
+    implicit_multiplication_application,
+    convert_xor,
+)
+
+from utils import settings
+from utils.metrics import timed
+
+_TRANSFORMATIONS = standard_transformations + (implicit_multiplication_application, convert_xor)
+
+# Seconds allowed for the worker process to start; not part of the solve budget
+STARTUP_TIMEOUT = 60
+
+# Symbols inserted by the math keyboard, rewritten to sympy syntax
+_KEYBOARD_SYMBOLS = {
+    "×": "*",
+    "÷": "/",
+    "−": "-",
+    "·": "*",
+    "π": " pi ",
+    "∞": " oo ",
+    "²": "**2",
+    "³": "**3",
+}
+
+# A square root sign applies to the number, letter or bracket right after it
+_ROOT_SIGN = re.compile(r"√\s*(\d+(?:\.\d+)?|[a-zA-Z]|\([^()]*\))")
+
+# "e" is Euler's number and "i" the imaginary unit rather than free symbols
+_LOCALS = {"e": sp.E, "i": sp.I}
+
+# LaTeX constructs rewritten innermost first, until nothing changes
+_LATEX_RULES = [
+    (re.compile(r"\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}"), r"((\1)/(\2))"),
+    (re.compile(r"\\sqrt\s*\[([^\[\]]*)\]\s*\{([^{}]*)\}"), r"root(\2, \1)"),
+    (re.compile(r"\\sqrt\s*\{([^{}]*)\}"), r"sqrt(\1)"),
+    (re.compile(r"\^\s*\{([^{}]*)\}"), r"**(\1)"),
+    (re.compile(r"\\(?:mathrm|text|operatorname)\s*\{([^{}]*)\}"), r" \1 "),
+]
+
+_LATEX_COMMANDS = {
+    r"\cdot": "*",
+    r"\times": "*",
+    r"\div": "/",
+    r"\pi": " pi ",
+    r"\infty": " oo ",
+    r"\ln": " log ",
+    r"\left": " ",
+    r"\right": " ",
+    r"\displaystyle": " ",
+}
+
+_DERIVATIVE = re.compile(
+    r"^(?:d\s*/\s*d\s*([a-z])|\\frac\s*\{\s*d\s*\}\s*\{\s*d\s*([a-z])\s*\}"
+    r"|derivative of|differentiate|diff)\s+(.+)$",
+    re.IGNORECASE,
+)
+_INTEGRAL = re.compile(r"^(?:integrate|integral of|∫|\\int)\s*(.+?)(?:\s*\\?,?\s*d\s*([a-z]))?$", re.IGNORECASE)
+# Words allowed in a problem answered locally; any other word means it is
+# prose that implicit multiplication would turn into a product of symbols
+_KNOWN_WORDS = {
+    "sin", "cos", "tan", "cot", "sec", "csc", "asin", "acos", "atan",
+    "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh", "log", "ln",
+    "exp", "sqrt", "root", "abs", "pi", "oo", "frac", "cdot", "times",
+    "div", "left", "right", "infty", "mathrm", "text", "operatorname",
+    "displaystyle", "dfrac", "tfrac",
+}
+
+_REWRITE = re.compile(r"^(simplify|factor|expand)\s+(.+)$", re.IGNORECASE)
+_SOLVE = re.compile(r"^solve\s+(.+?)(?:\s+for\s+([a-z]))?$", re.IGNORECASE)
+
+
+def latex_to_text(latex):
+    # Rewrite the LaTeX produced by texify into sympy syntax
+    text = latex.replace("$", " ")
+    changed = True
+    while changed:
+        changed = False
+        for pattern, replacement in _LATEX_RULES:
+            text, count = pattern.subn(replacement, text)
+            changed = changed or count > 0
+    for command, replacement in _LATEX_COMMANDS.items():
+        text = text.replace(command, replacement)
+    # Remaining commands are function names such as \sin or \log
+    text = re.sub(r"\\([a-zA-Z]+)", r" \1 ", text)
+    text = re.sub(r"\\.", " ", text)
+    return text.replace("{", "(").replace("}", ")")
+
+
+def _check_words(text):
+    for word in re.findall(r"[a-zA-Z]{2,}", text):
+        if word.lower() not in _KNOWN_WORDS:
+            raise ValueError(f"Unexpected word: {word}")
+
+
+def parse_math(text):
+    """
+    Parse a math expression typed by the user, from the math keyboard or from texify.
+
+    Implicit multiplication ("2x", "sin x") and "^" for powers are accepted.
+
+    Raises:
+    sp.SympifyError: If the text is not a valid expression.
+    """
+    text = _ROOT_SIGN.sub(r" sqrt(\1) ", text).replace("√", " sqrt ")
+    for symbol, replacement in _KEYBOARD_SYMBOLS.items():
+        text = text.replace(symbol, replacement)
+    if "\\" in text or "{" in text:
+        text = latex_to_text(text)
+    try:
+        return parse_expr(text, local_dict=_LOCALS, transformations=_TRANSFORMATIONS)
+    except Exception as e:
+        raise sp.SympifyError(text, e)
+
+
+def parse_equation(text):
+    # Parse "left = right", or treat a lone expression as "expression = 0"
+    if "=" in text:
+        left, right = text.split("=", 1)
+        return sp.Eq(parse_math(left), parse_math(right))
+    return sp.Eq(parse_math(text), 0)
+
+
+def _variable(expr, name=None):
+    if name:
+        return sp.Symbol(name)
+    symbols = sorted(expr.free_symbols, key=lambda s: s.name)
+    x = sp.Symbol("x")
+    if x in symbols or not symbols:
+        return x
+    return symbols[0]
+
+
+def _math(expr):
+    return f"${sp.latex(expr)}$"
+
+
+def _finite(*exprs):
+    # Results with division by zero or undefined values are left to the LLM
+    return not any(sp.sympify(e).has(sp.zoo, sp.nan, sp.oo, -sp.oo) for e in exprs)
+
+
+def _solve(text, name=None):
+    eq = parse_equation(text)
+    var = _variable(eq, name)
+    # Only a finite set of real solutions is a complete answer; periodic
+    # families (sin(x) = 0), conditions, intervals and equations with no
+    # real solution go to the LLM, which can explain them
+    solutions = sp.solveset(eq, var, domain=sp.S.Reals)
+    if not isinstance(solutions, sp.FiniteSet) or not solutions or not _finite(*solutions):
+        return None
+    solutions = sorted(solutions, key=sp.default_sort_key)
+    answer = ", ".join(f"{sp.latex(var)} = {sp.latex(s)}" for s in solutions)
+    return {
+        "operation": "solve",
+        "steps": [
+            f"Start from the equation {_math(eq)}",
+            f"Move every term to one side: ${sp.latex(eq.lhs - eq.rhs)} = 0$",
+            f"Solve for ${sp.latex(var)}$",
+        ],
+        "answer": f"${answer}$",
+    }
+
+
+def _differentiate(text, name=None):
+    expr = parse_math(text)
+    var = _variable(expr, name)
+    derivative = sp.diff(expr, var)
+    simplified = sp.simplify(derivative)
+    if not _finite(simplified):
+        return None
+    steps = [f"Differentiate {_math(expr)} with respect to ${sp.latex(var)}$", f"Apply the rules term by term: {_math(derivative)}"]
+    if simplified != derivative:
+        steps.append(f"Simplify: {_math(simplified)}")
+    return {"operation": "differentiate", "steps": steps, "answer": _math(simplified)}
+
+
+def _integrate(text, name=None):
+    expr = parse_math(text)
+    var = _variable(expr, name)
+    integral = sp.integrate(expr, var)
+    if integral.has(sp.Integral) or not _finite(integral):
+        return None
+    return {
+        "operation": "integrate",
+        "steps": [
+            f"Integrate {_math(expr)} with respect to ${sp.latex(var)}$",
+            f"Find an antiderivative: {_math(integral)}",
+            "Add the constant of integration",
+        ],
+        "answer": f"${sp.latex(integral)} + C$",
+    }
+
+
+def _is_statement(expr):
+    # Inequalities and truth values have no value to simplify; like the
+    # intervals _solve gives up on, they are left to the LLM
+    return isinstance(expr, sp.logic.boolalg.Boolean)
+
+
+def _rewrite(operation, text):
+    expr = parse_math(text)
+    if _is_statement(expr):
+        return None
+    result = {"simplify": sp.simplify, "factor": sp.factor, "expand": sp.expand}[operation](expr)
+    # An unchanged expression would hand the problem back as its own answer
+    if result == expr or not _finite(result):
+        return None
+    return {
+        "operation": operation,
+        "steps": [f"Start from {_math(expr)}", f"{operation.capitalize()}: {_math(result)}"],
+        "answer": _math(result),
+    }
+
+
+def _evaluate(text):
+    expr = parse_math(text)
+    if _is_statement(expr):
+        return None
+    if expr.free_symbols:
+        return _rewrite("simplify", text)
+    exact = sp.nsimplify(expr) if expr.is_Float else sp.simplify(expr)
+    if not _finite(exact):
+        # e.g. 1/0, which sympy calls complex infinity
+        return None
+    steps = [f"Evaluate {_math(expr)}", f"Exact value: {_math(exact)}"]
+    answer = _math(exact)
+    if not exact.is_Integer:
+        approx = sp.N(exact, 10)
+        steps.append(f"Decimal value: {_math(approx)}")
+    return {"operation": "evaluate", "steps": steps, "answer": answer}
+
+
+def solve_problem(text):
+    """
+    Try to answer a problem with sympy alone.
+
+    Understands equations ("solve ... for y" or anything with "="), derivatives
+    ("d/dx ...", "derivative of ..."), indefinite integrals ("integrate ... dx"),
+    "simplify/factor/expand ..." and plain expressions.
+
+    Returns:
+    dict: 'operation', 'steps' (markdown strings) and 'answer', or None when
+          the problem is outside what sympy can answer here.
+    """
+    text = text.strip()
+    try:
+        match = _DERIVATIVE.match(text)
+        if match:
+            _check_words(match.group(3))
+            return _differentiate(match.group(3), match.group(1) or match.group(2))
+        match = _INTEGRAL.match(text)
+        if match:
+            if match.group(1).lstrip().startswith(("_", "^")):
+                # Definite integrals are left to the LLM
+                return None
+            _check_words(match.group(1))
+            return _integrate(match.group(1), match.group(2))
+        match = _REWRITE.match(text)
+        if match:
+            _check_words(match.group(2))
+            return _rewrite(match.group(1).lower(), match.group(2))
+        match = _SOLVE.match(text)
+        if match:
+            _check_words(match.group(1))
+            return _solve(match.group(1), match.group(2))
+        _check_words(text)
+        if text.count("=") == 1:
+            return _solve(text)
+        return _evaluate(text)
+    except Exception:
+        return None
+
+
+def _ping():
+    return True
+
+
+class WorkerStartupError(RuntimeError):
+    """Raised when a sympy worker process does not start within STARTUP_TIMEOUT."""
+
+
+class SymbolicWorker:
+    """
+    A few worker processes that run sympy calls under a hard time limit.
+
+    Each call takes a free process, so one slow problem does not hold up
+    the other sessions. sympy cannot be interrupted from another thread, so
+    a call that overruns its budget is stopped by terminating its process;
+    a fresh one takes its place. The lock only guards starting processes.
+    """
+
+    def __init__(self, processes=settings.SYMBOLIC_WORKERS):
+        self.processes = max(1, processes)
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def _start_process(self):
+        pool = multiprocessing.get_context("spawn").Pool(1)
+        return pool, pool.apply_async(_ping)
+
+    def warm_up(self):
+        with self._lock:
+            while self._started < self.processes:
+                self._idle.put(self._start_process())
+                self._started += 1
+
+    def run(self, fn, *args, timeout):
+        self.warm_up()
+        try:
+            # Waiting for a busy worker counts against the budget too
+            pool, ready = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No sympy worker free within {timeout}s")
+        try:
+            try:
+                ready.get(STARTUP_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                # Usually a script without a __main__ guard: each spawned
+                # process re-runs it and fails before it can take work
+                pool.terminate()
+                pool, ready = self._start_process()
+                raise WorkerStartupError(
+                    f"The sympy worker process did not start within {STARTUP_TIMEOUT}s; scripts that "
+                    "solve or plot must do so under 'if __name__ == \"__main__\":'"
+                ) from None
+            return pool.apply_async(fn, args).get(timeout)
+        except multiprocessing.TimeoutError:
+            pool.terminate()
+            pool, ready = self._start_process()
+            raise TimeoutError(f"{fn.__name__} took longer than {timeout}s")
+        finally:
+            self._idle.put((pool, ready))
+
+
+worker = SymbolicWorker()
+
+
+def warm_up():
+    # Start the worker process ahead of the first problem
+    worker.warm_up()
+
+
+def solve_symbolic(text, timeout=None):
+    # Answer with sympy in the worker process, or return None if it cannot
+    # within the time budget. WorkerStartupError is raised, not swallowed:
+    # no problem can be answered until it is fixed.
+    timeout = settings.SYMBOLIC_TIMEOUT if timeout is None else timeout
+    try:
+        with timed("symbolic"):
+            return worker.run(solve_problem, text, timeout=timeout)
+    except TimeoutError:
+        return None
+
+
+def format_steps(result):
+    lines = [f"{i}. {step}" for i, step in enumerate(result["steps"], start=1)]
+    lines.append(f"\n**Answer:** {result['answer']}")
+    return "\n".join(lines)
@@ -1,12 +0,0 @@
-MATH_SYMBOLS = {
-    "Arithmetic": ['+', '-', '×', '÷', '=', '≠', '≈', '^', '√', '∛', '∜'],
-    "Greek Letters": ['α', 'β', 'γ', 'δ', 'θ', 'π', 'λ', 'μ', 'σ', 'φ', 'ω'],
-    "Comparison": ['<', '>', '≤', '≥', '≪', '≫'],
-    "Set Theory": ['∈', '∉', '⊂', '⊃', '∪', '∩', '∅'],
-    "Logic": ['∧', '∨', '¬', '⇒', '⇔', '∀', '∃'],
-    "Calculus": ['∫', '∂', 'dx', 'dy', '∇', 'lim'],
-    "Functions": ['sin', 'cos', 'tan', 'log', 'ln', 'exp'],
-    "Constants": ['π', 'e', 'i', '∞'],
-    "Arrows": ['→', '←', '↔', '⇒', '⇐', '⇔'],
-    "LaTeX": ['\\frac', '\\sqrt', '\\sum', '\\prod', '\\int']
-}
\ No newline at end of file
@@ -0,0 +1,104 @@
+# ######################################################
+#                                                      #
+#     Incremental whiteboard recognition: strokes are  #
+#     grouped into lines and only changed lines are    #
+#                 sent back to texify.                 #
+#                                                      #
+# ######################################################
+
+
+import hashlib
+import json
+
+from texify.output import replace_katex_invalid
+
+from utils.helper import infer_images
+
+# Strokes closer than this vertically, in canvas pixels, belong to the same line
+LINE_GAP = 12
+
+# Blank space kept around a line when it is cropped for OCR
+LINE_PADDING = 4
+
+
+def stroke_bounds(obj):
+    # Canvas-space (left, top, right, bottom) of a fabric.js object
+    pad = obj.get("strokeWidth", 0) / 2
+    left, top = obj.get("left", 0), obj.get("top", 0)
+    right = left + obj.get("width", 0) * obj.get("scaleX", 1)
+    bottom = top + obj.get("height", 0) * obj.get("scaleY", 1)
+    return left - pad, top - pad, right + pad, bottom + pad
+
+
+def cluster_strokes(objects, gap=LINE_GAP):
+    """
+    Group canvas objects into expression lines by vertical overlap.
+
+    Parameters:
+    objects (list): fabric.js objects from the canvas json_data.
+    gap (int): Largest vertical gap between strokes of the same line.
+
+    Returns:
+    list: One dict per line, top to bottom, with 'bbox' and 'strokes'.
+    """
+    clusters = []
+    for obj in sorted(objects, key=lambda o: stroke_bounds(o)[1]):
+        left, top, right, bottom = stroke_bounds(obj)
+        if clusters and top <= clusters[-1]["bbox"][3] + gap:
+            cluster = clusters[-1]
+            l, t, r, b = cluster["bbox"]
+            cluster["bbox"] = [min(l, left), t, max(r, right), max(b, bottom)]
+            cluster["strokes"].append(obj)
+        else:
+            clusters.append({"bbox": [left, top, right, bottom], "strokes": [obj]})
+    return clusters
+
+
+def cluster_signature(strokes, temperature):
+    # Identifies a line by its strokes, so untouched lines keep their result
+    payload = json.dumps([strokes, temperature], sort_keys=True).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def recognize_board(image, json_data, previous=None, temperature=0.7, canvas_width=None):
+    """
+    OCR a whiteboard line by line, reusing the results of unchanged lines.
+
+    Parameters:
+    image (PIL.Image): The canvas image_data as an image.
+    json_data (dict): The canvas json_data, holding the stroke objects.
+    previous (dict): Line results from the last run, keyed by signature.
+    temperature (float): Sampling temperature for texify.
+    canvas_width (int): Canvas width in stroke coordinates, if the image
+                        was rendered at a different scale.
+
+    Returns:
+    tuple: (problem, results), the recognized LaTeX of every line joined
+           top to bottom, and the line results to pass in on the next run.
+    """
+    previous = previous or {}
+    objects = (json_data or {}).get("objects", [])
+    clusters = cluster_strokes(objects)
+    scale = image.width / canvas_width if canvas_width else 1
+
+    signatures = [cluster_signature(c["strokes"], temperature) for c in clusters]
+    changed = [i for i, signature in enumerate(signatures) if signature not in previous]
+
+    bboxes = []
+    for i in changed:
+        left, top, right, bottom = clusters[i]["bbox"]
+        bboxes.append((
+            max(0, int((left - LINE_PADDING) * scale)),
+            max(0, int((top - LINE_PADDING) * scale)),
+            min(image.width, int((right + LINE_PADDING) * scale) + 1),
+            min(image.height, int((bottom + LINE_PADDING) * scale) + 1),
+        ))
+    outputs = infer_images(image, bboxes, temperature) if bboxes else []
+
+    # Only the lines still on the board are carried over to the next run
+    results = {signature: previous[signature] for signature in signatures if signature in previous}
+    for i, output in zip(changed, outputs):
+        results[signatures[i]] = replace_katex_invalid(output)
+
+    lines = [results[signature] for signature in signatures if results[signature]]
+    return "\n".join(lines), results